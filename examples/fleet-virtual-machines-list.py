@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+
+from vmwc import FleetClient
+
+
+def main():
+    hosts = ['192.168.1.1', '192.168.1.2', '192.168.1.3']
+    username = '<username>'
+    password = '<password>'
+
+    with FleetClient(hosts, username, password, timeout=60) as fleet:
+        for host, vm in fleet.get_virtual_machines():
+            print('{} {}'.format(host, vm.name))
+
+        for host, error in fleet.errors.items():
+            print('{} failed. {}'.format(host, error))
+
+
+if __name__ == '__main__':
+    main()
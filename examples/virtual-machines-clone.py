@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+from vmwc import VMWareClient
+
+
+def main():
+    host = '192.168.1.1'
+    username = '<username>'
+    password = '<password>'
+
+    template_name = 'ubuntu-template'
+    snapshot_name = 'MY-AWESOME-SNAPSHOT'
+
+    # Cloning requires vCenter
+    with VMWareClient(host, username, password) as client:
+        template = client.get_virtual_machine(template_name)
+
+        # A single linked clone, with more resources and on another network
+        vm = template.clone('Virtual Machine 1', snapshot_name=snapshot_name, linked=True, cpus=4, ram_mb=4096, network_name='Lab')
+        print('cloned "{}"'.format(vm.name))
+
+        # Many linked clones at once
+        names = ['Virtual Machine {}'.format(i) for i in range(2, 12)]
+        for result in template.clone_many(names, snapshot_name=snapshot_name, linked=True, power_on=True):
+            if result.succeeded:
+                print('cloned "{}"'.format(result.result.name))
+            else:
+                print('failed to clone "{}". {}'.format(result.target, result.error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+
+from vmwc import VMWareClient
+
+
+def main():
+    host = '192.168.1.1'
+    username = '<username>'
+    password = '<password>'
+
+    specs = [{'name': 'Virtual Machine {}'.format(i), 'cpus': 2, 'ram_mb': 1024, 'disk_size_gb': 20} for i in range(1, 11)]
+
+    with VMWareClient(host, username, password) as client:
+        for result in client.new_virtual_machines(specs, max_workers=4):
+            if result.succeeded:
+                print('created "{}"'.format(result.result.name))
+            else:
+                print('failed to create "{}". {}'.format(result.target, result.error))
+
+
+if __name__ == '__main__':
+    main()
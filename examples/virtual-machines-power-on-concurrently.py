@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+from vmwc import VMWareClient
+
+
+def main():
+    host = '192.168.1.1'
+    username = '<username>'
+    password = '<password>'
+
+    with VMWareClient(host, username, password) as client:
+        # Issue all the power on requests first, then collect them
+        pending = [(vm, vm.power_on(wait=False)) for vm in client.get_virtual_machines()]
+
+        for vm, future in pending:
+            try:
+                future.result()
+                print('powered on "{}"'.format(vm.name))
+            except Exception as e:
+                print('failed to power on "{}". {}'.format(vm.name, e))
+
+
+if __name__ == '__main__':
+    main()
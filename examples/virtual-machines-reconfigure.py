@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+from vmwc import VMWareClient
+
+
+def main():
+    host = '192.168.1.1'
+    username = '<username>'
+    password = '<password>'
+
+    with VMWareClient(host, username, password) as client:
+        vm = client.get_virtual_machine('Virtual Machine 1')
+
+        # All of the changes below are applied together, in a single reconfiguration task
+        with vm.reconfigure() as changes:
+            changes.set_cpus(4).set_memory(8192)
+            changes.remove_all_network_interfaces()
+            changes.add_network_interface('VM Network')
+            changes.add_network_interface('Custom Network 1')
+            changes.extend_disk('Hard disk 1', 40)
+            changes.add_disk(100)
+            changes.configure_bios(boot_order=['disk', 'cdrom'])
+
+
+if __name__ == '__main__':
+    main()
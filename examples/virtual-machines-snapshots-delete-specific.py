@@ -15,9 +15,10 @@ def main():
 
     with VMWareClient(host, username, password) as client:
         for vm in client.get_virtual_machines():
-            for snapshot in vm.get_snapshots():
-                if snapshot.name == snapshot_name:
-                    snapshot.delete()
+            # Snapshot names are not unique, delete all of the snapshots with that name.
+            # deepest first, a snapshot deleted with its children could otherwise be deleted again
+            for snapshot in reversed(vm.get_snapshot_tree().get_all_by_name(snapshot_name)):
+                snapshot.delete()
 
 
 if __name__ == '__main__':
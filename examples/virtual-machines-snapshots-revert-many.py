@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+from vmwc import VMWareClient
+
+
+def main():
+    host = '192.168.1.1'
+    username = '<username>'
+    password = '<password>'
+
+    vm_names = ['lab-01', 'lab-02', 'lab-03']
+    snapshot_name = 'MY-AWESOME-SNAPSHOT'
+
+    print('WARNING - you must acknowledge that by executing the code below will result in revert of snapshots. (remove the "return" statement and re run this script to proceed)')
+    return
+
+    with VMWareClient(host, username, password) as client:
+        # At most 2 reverts run at the same time on each ESXi host and on each datastore
+        for result in client.revert_snapshots(vm_names, snapshot_name, max_per_host=2, max_per_datastore=2):
+            name = getattr(result.target, 'name', result.target)
+            if result.succeeded:
+                print('reverted "{}"'.format(name))
+            else:
+                print('failed to revert "{}". {}'.format(name, result.error))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,9 +15,9 @@ def main():
 
     with VMWareClient(host, username, password) as client:
         for vm in client.get_virtual_machines():
-            for snapshot in vm.get_snapshots():
-                if snapshot.name == snapshot_name:
-                    snapshot.revert()
+            snapshot = vm.get_snapshot(snapshot_name)
+            if snapshot:
+                snapshot.revert()
 
 
 if __name__ == '__main__':
@@ -79,7 +79,7 @@ setup(
     # your project is installed. For an analysis of "install_requires" vs pip's
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=['requests', 'pyvmomi>=6.5'],
+    install_requires=['requests', 'pyvmomi>=6.5', 'futures; python_version < "3"'],
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
@@ -1,9 +1,18 @@
+import collections
+import copy
+import inspect
+import json
 import logging
-import random
+import math
+import os
 import requests
+import tarfile
+import tempfile
+import threading
 import time
 import datetime
 import sys
+from concurrent import futures
 
 # ----------------------------------
 # Patch the urlib3 annoying warnings
@@ -32,14 +41,80 @@ except Exception as e:
 
 # ----------------------------------
 
+# Properties fetched in bulk for every virtual machine when enumerating the inventory
+VIRTUAL_MACHINE_PROPERTIES = (
+    'name',
+    'summary.config.uuid',
+    'runtime.powerState',
+)
+
+# ESXi host configuration managers, resolved once and cached per client
+HOST_REFERENCE_PROPERTIES = (
+    'configManager.networkSystem',
+    'configManager.serviceSystem',
+    'configManager.dateTimeSystem',
+)
+
+# Properties needed to place and throttle snapshot operations, plus the snapshot hierarchy for the ones looking up a snapshot
+SNAPSHOT_PLACEMENT_PROPERTIES = VIRTUAL_MACHINE_PROPERTIES + ('runtime.host', 'datastore')
+SNAPSHOT_TARGET_PROPERTIES = SNAPSHOT_PLACEMENT_PROPERTIES + ('snapshot',)
+
+# Properties of every datastore, read in bulk by get_datastores()
+DATASTORE_PROPERTIES = ('summary', 'info', 'host')
+
+# Managed object types that can be looked up by name, see VMWareClient.get_managed_object()
+RESOLVABLE_TYPES = (vim.Network, vim.Datastore, vim.HostSystem, vim.ResourcePool, vim.Folder)
+
+# Properties kept up to date by the InventoryMirror, per managed object type
+INVENTORY_MIRROR_PROPERTIES = {
+    vim.VirtualMachine: VIRTUAL_MACHINE_PROPERTIES + ('snapshot', 'guest.toolsStatus'),
+    vim.HostSystem: ('name', 'runtime.connectionState', 'runtime.powerState'),
+    vim.Datastore: ('name', 'summary.capacity', 'summary.freeSpace', 'summary.accessible', 'summary.type'),
+    vim.Network: ('name',),
+}
+
 
 class VMWareClient(object):
-    def __init__(self, host, username, password, port=443, verify=False):
+    # Datastore usage changes all the time, keep the listing for a short while only
+    datastore_cache_seconds = 10
+
+    def __init__(self, host, username, password, port=443, verify=False, session_cache_path=None, keepalive_seconds=None, http_pool_connections=10, http_pool_maxsize=10, connection_timeout=None):
+        """
+        :param session_cache_path: file to persist the session cookie in, so following connections (also from other processes) reuse a still valid session instead of logging in again
+        :param keepalive_seconds: interval of keepalive calls that prevent the session of a long-lived client from expiring
+        :param http_pool_connections: number of hosts to keep connection pools for, used by guest file transfers
+        :param http_pool_maxsize: maximum number of keep-alive connections kept per host, used by guest file transfers
+        :param connection_timeout: socket timeout in seconds of the SOAP connection, so an unresponsive host fails instead of hanging. requires pyvmomi 6.7.1+
+        """
+
         self.host = host
         self.username = username
         self.password = password
         self.port = port
         self.verify = verify
+        self.session_cache_path = session_cache_path
+        self.keepalive_seconds = keepalive_seconds
+        self.http_pool_connections = http_pool_connections
+        self.http_pool_maxsize = http_pool_maxsize
+        self.connection_timeout = connection_timeout
+
+        if connection_timeout is not None and not self._supports_connection_timeout():
+            raise Exception('connection_timeout requires pyvmomi 6.7.1 or later')
+
+        # Lookup caches, see invalidate_caches()
+        self._virtual_machine_index = None
+        self._virtual_switch_index = None
+        self._esxi_hosts = None
+        self._datastores = None
+        self._datastores_expiration = 0
+        self._managed_object_indexes = {}
+
+        self._task_tracker = None
+        self._task_tracker_lock = threading.Lock()
+        self._inventory_mirror = None
+        self._keepalive_stop_event = None
+        self._http_session = None
+        self._http_session_lock = threading.Lock()
 
     def __enter__(self):
 
@@ -51,17 +126,207 @@ class VMWareClient(object):
         except:
             pass
 
-        self._session = pyVim.connect.SmartConnect(host=self.host, user=self.username, pwd=self.password, port=self.port, sslContext=ssl_context)
+        if self.session_cache_path or self.keepalive_seconds:
+            self._session = self._connect_session_oriented(ssl_context)
+        else:
+            self._session = pyVim.connect.SmartConnect(host=self.host, user=self.username, pwd=self.password, port=self.port, sslContext=ssl_context, **self._get_connection_options())
+
         self._content = self._session.RetrieveContent()
 
+        if self.session_cache_path:
+            self._save_session_cookie()
+
+        if self.keepalive_seconds:
+            self._keepalive_stop_event = threading.Event()
+            thread = threading.Thread(target=self._keepalive, args=(self._keepalive_stop_event,), name='vmwc-keepalive')
+            thread.daemon = True
+            thread.start()
+
         return self
 
     def __exit__(self, type, value, traceback):
-        pyVim.connect.Disconnect(self._session)
+        self.disable_inventory_mirror()
+
+        with self._task_tracker_lock:
+            if self._task_tracker:
+                self._task_tracker.stop()
+                self._task_tracker = None
+
+        if self._keepalive_stop_event:
+            self._keepalive_stop_event.set()
+            self._keepalive_stop_event = None
+
+        with self._http_session_lock:
+            if self._http_session:
+                self._http_session.close()
+                self._http_session = None
+
+        if self.session_cache_path:
+            # Leave the session logged in for the next connection, only drop the local connections
+            self._save_session_cookie()
+            self._session._stub.soapStub.DropConnections()
+        else:
+            pyVim.connect.Disconnect(self._session)
+
+    @property
+    def http_session(self):
+        """
+        Keep-alive HTTP session shared by all the file transfers of this client, so they reuse connections instead of a TCP and TLS handshake each
+        """
+
+        # Transfers of concurrent threads must not create sessions of their own, which would never be closed
+        with self._http_session_lock:
+            if self._http_session is None:
+                http_session = requests.Session()
+                http_session.verify = self.verify
+
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.http_pool_connections, pool_maxsize=self.http_pool_maxsize)
+                http_session.mount('https://', adapter)
+                http_session.mount('http://', adapter)
+
+                self._http_session = http_session
+
+            return self._http_session
+
+    def _get_connection_options(self):
+        # Older pyvmomi versions do not know httpConnectionTimeout, only pass it when it is used
+        if self.connection_timeout is None:
+            return {}
+
+        return {'httpConnectionTimeout': self.connection_timeout}
+
+    @staticmethod
+    def _supports_connection_timeout():
+        # httpConnectionTimeout was added to the connect functions in pyvmomi 6.7.1
+        try:
+            parameters = inspect.signature(pyVim.connect.SmartConnect).parameters
+        except AttributeError:
+            parameters = inspect.getargspec(pyVim.connect.SmartConnect).args
+
+        return 'httpConnectionTimeout' in parameters
+
+    def _connect_session_oriented(self, ssl_context):
+        # The session oriented stub logs in lazily, only when the current session is not valid, and logs in again on NotAuthenticated
+        soap_stub = pyVim.connect.SmartStubAdapter(host=self.host, port=self.port, sslContext=ssl_context, **self._get_connection_options())
+
+        cookie = self._load_session_cookie()
+        if cookie:
+            soap_stub.cookie = cookie
+
+        login_method = pyVim.connect.VimSessionOrientedStub.makeUserLoginMethod(self.username, self.password)
+        session_stub = pyVim.connect.VimSessionOrientedStub(soap_stub, login_method)
+        return vim.ServiceInstance('ServiceInstance', session_stub)
+
+    def _load_session_cookie(self):
+        if not self.session_cache_path or not os.path.exists(self.session_cache_path):
+            return None
+
+        try:
+            with open(self.session_cache_path) as f:
+                session = json.load(f)
+        except (IOError, ValueError) as e:
+            logging.warning('ignoring unreadable session cache "{0}". {1}'.format(self.session_cache_path, e))
+            return None
+
+        if (session.get('host'), session.get('port'), session.get('username')) != (self.host, self.port, self.username):
+            return None
+
+        return session.get('cookie')
+
+    def _save_session_cookie(self):
+        session = {
+            'host': self.host,
+            'port': self.port,
+            'username': self.username,
+            'cookie': self._session._stub.soapStub.cookie,
+        }
+
+        # The cookie grants access to the session, keep it private to the current user
+        fd = os.open(self.session_cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(session, f)
+
+    def _keepalive(self, stop_event):
+        while not stop_event.wait(self.keepalive_seconds):
+            try:
+                self._session.CurrentTime()
+            except Exception as e:
+                logging.warning('session keepalive failed. {0}'.format(e))
+
+    def enable_inventory_mirror(self, wait_until_ready=True, timeout=None):
+        """
+        Mirrors virtual machines, hosts, datastores and networks locally, kept up to date by a background thread.
+        While enabled, inventory and state queries are answered from the mirror instead of the server
+        """
+
+        if self._inventory_mirror is None:
+            # Attached only once started, a mirror that failed to start is not left behind
+            inventory_mirror = InventoryMirror(self)
+            inventory_mirror.start()
+            self._inventory_mirror = inventory_mirror
+
+        if wait_until_ready and not self._inventory_mirror.wait_until_ready(timeout):
+            raise Exception('timed out after {0} seconds waiting for the inventory mirror'.format(timeout))
+
+        return self._inventory_mirror
+
+    def disable_inventory_mirror(self):
+        if self._inventory_mirror:
+            self._inventory_mirror.stop()
+            self._inventory_mirror = None
+
+    def _get_ready_inventory_mirror(self):
+        inventory_mirror = self._inventory_mirror
+        if inventory_mirror and inventory_mirror.is_ready():
+            return inventory_mirror
+
+        return None
 
     def get_virtual_machines(self):
-        for virtual_machine in self._iterate_virtual_machines():
-            yield VirtualMachine(self, virtual_machine)
+        inventory_mirror = self._get_ready_inventory_mirror()
+        if inventory_mirror:
+            for virtual_machine, properties in inventory_mirror.get_objects(vim.VirtualMachine):
+                yield VirtualMachine(self, virtual_machine, properties)
+            return
+
+        items = self._retrieve_properties(vim.VirtualMachine, VIRTUAL_MACHINE_PROPERTIES)
+
+        # A full enumeration is a free opportunity to refresh the name index
+        self._virtual_machine_index = dict((properties['name'], virtual_machine) for virtual_machine, properties in items)
+
+        for virtual_machine, properties in items:
+            yield VirtualMachine(self, virtual_machine, properties)
+
+    def invalidate_caches(self):
+        self._virtual_machine_index = None
+        self._virtual_switch_index = None
+        self._esxi_hosts = None
+        self._datastores = None
+        self._managed_object_indexes = {}
+
+    def _get_virtual_machine_index(self, rebuild=False):
+        if self._virtual_machine_index is None or rebuild:
+            items = self._retrieve_properties(vim.VirtualMachine, ['name'])
+            self._virtual_machine_index = dict((properties['name'], virtual_machine) for virtual_machine, properties in items)
+
+        return self._virtual_machine_index
+
+    def _load_virtual_machine(self, raw_virtual_machine):
+        if raw_virtual_machine is None:
+            return None
+
+        try:
+            items = self._retrieve_properties(vim.VirtualMachine, VIRTUAL_MACHINE_PROPERTIES, objects=[raw_virtual_machine])
+        except vmodl.fault.ManagedObjectNotFound:
+            return None
+
+        for virtual_machine, properties in items:
+            return VirtualMachine(self, virtual_machine, properties)
+
+    def _load_virtual_machines(self, raw_virtual_machines):
+        # Same as _load_virtual_machine, for many virtual machines in a single call. missing ones are left out
+        items = self._retrieve_properties(vim.VirtualMachine, VIRTUAL_MACHINE_PROPERTIES, objects=list(raw_virtual_machines))
+        return [VirtualMachine(self, virtual_machine, properties) for virtual_machine, properties in items]
 
     def revert_to_snapshot(self, vm_name, snapshot_name):
 
@@ -75,116 +340,736 @@ class VMWareClient(object):
 
         snapshot.revert()
 
-    def _iterate_virtual_machines(self):
-        children = self._content.rootFolder.childEntity
-        for child in children:
-            if hasattr(child, 'vmFolder'):
-                datacenter = child
-            else:
-                continue
+    def _retrieve_properties(self, obj_type, path_set, objects=None, container=None):
+        """
+        Retrieves the given properties of many managed objects using a single PropertyCollector query
+        :param obj_type: managed object type, e.g. vim.VirtualMachine
+        :param path_set: property paths to retrieve, e.g. ['name', 'runtime.powerState']
+        :param objects: specific managed objects to retrieve. when omitted, all objects of obj_type in the inventory are retrieved
+        :param container: folder or datacenter to limit the inventory to, when objects is omitted. defaults to the root folder
+        :return: list of (managed object, {property path: value}) tuples
+        """
 
-            vm_folder = datacenter.vmFolder
-            folder_entities = vm_folder.childEntity
-            for virtual_machine in self._iterate_folder(folder_entities):
-                yield virtual_machine
+        view = None
 
-    def _is_folder(self, item):
-        return hasattr(item, 'childEntity')
+        if objects is None:
+            view = self._content.viewManager.CreateContainerView(container or self._content.rootFolder, [obj_type], True)
+            traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseEntities', path='view', skip=False, type=vim.view.ContainerView)
+            object_set = [vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal_spec])]
+        else:
+            object_set = [vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False) for obj in objects]
 
-    def _is_virtual_machine(self, item):
-        return hasattr(item, 'summary')
+        items = []
 
-    def _iterate_folder(self, folder):
-        for item in folder:
+        try:
+            if not object_set:
+                return items
 
-            if self._is_folder(item):
-                for virtual_machine in self._iterate_folder(item.childEntity):
-                    yield virtual_machine
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+            filter_spec.objectSet = object_set
+            filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=list(path_set), all=False)]
 
-            elif self._is_virtual_machine(item):
-                yield item
+            property_collector = self._content.propertyCollector
+            result = property_collector.RetrievePropertiesEx([filter_spec], vmodl.query.PropertyCollector.RetrieveOptions())
 
-            else:
-                logging.warning('Unsupported item "{item}". skipping'.format(item=item))
+            while result:
+                for object_content in result.objects:
+                    # Unset properties are omitted from the response
+                    properties = dict.fromkeys(path_set)
+                    for dynamic_property in object_content.propSet:
+                        properties[dynamic_property.name] = dynamic_property.val
 
-    def wait(self, task):
+                    items.append((object_content.obj, properties))
 
-        filter_spec = vmodl.query.PropertyCollector.FilterSpec()
-        filter_spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=task)]
-        filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=[], all=True)]
-        filter_instance = self._content.propertyCollector.CreateFilter(filter_spec, True)
+                if not result.token:
+                    break
+
+                result = property_collector.ContinueRetrievePropertiesEx(result.token)
+
+        finally:
+            if view:
+                view.Destroy()
+
+        return items
+
+    def wait(self, task, timeout=None, cancel_on_timeout=False, progress_callback=None):
+        """
+        Waits for a task to complete
+        :param timeout: seconds to wait before giving up. waits forever by default
+        :param cancel_on_timeout: cancel the task (CancelTask) when the timeout expires
+        :param progress_callback: called as progress_callback(task, progress) whenever info.progress changes
+        :return: the task result
+        """
+
+        task_result = next(self.iterate_task_results([task], timeout=timeout, cancel_on_timeout=cancel_on_timeout, progress_callback=progress_callback))
+        if not task_result.succeeded:
+            raise Exception(task_result.error)
+
+        return task_result.result
+
+    def iterate_task_results(self, tasks, timeout=None, cancel_on_timeout=False, progress_callback=None):
+        """
+        Tracks many tasks through a single PropertyCollector filter, yielding a TaskResult for each task as soon as it completes
+        :param tasks: vim.Task references
+        :param timeout: seconds to wait for all the tasks before giving up. waits forever by default
+        :param cancel_on_timeout: cancel the tasks still running (CancelTask) when the timeout expires
+        :param progress_callback: called as progress_callback(task, progress) whenever a task's info.progress changes
+        """
+
+        pending = dict((task._moId, task) for task in tasks)
+        if not pending:
+            return
+
+        # A dedicated collector isolates these updates from filters created elsewhere on the session
+        property_collector = self._content.propertyCollector.CreatePropertyCollector()
         try:
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+            filter_spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=task) for task in pending.values()]
+            filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info.state', 'info.progress', 'info.result', 'info.error'])]
+            property_collector.CreateFilter(filter_spec, True)
+
+            task_values = dict((task_id, {}) for task_id in pending)
             updates_version = None
-            task_state = None
+            deadline = None if timeout is None else time.time() + timeout
+
+            while pending:
+                # Block on the server rather than sleep-polling, bounded by the deadline if there is one
+                wait_options = vmodl.query.PropertyCollector.WaitOptions()
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        if cancel_on_timeout:
+                            self._cancel_tasks(pending.values())
+
+                        raise Exception('timed out after {0} seconds waiting for tasks {1}'.format(timeout, ', '.join(sorted(pending))))
+
+                    wait_options.maxWaitSeconds = int(math.ceil(remaining))
+
+                updates_info = property_collector.WaitForUpdatesEx(updates_version, wait_options)
+                if updates_info is None:
+                    continue
 
-            while True:
-                updates_info = self._content.propertyCollector.WaitForUpdates(updates_version)
                 updates_version = updates_info.version
 
                 for filter_set in updates_info.filterSet:
                     for object_set in filter_set.objectSet:
-                        current_task = object_set.obj
+                        task_id = object_set.obj._moId
+                        if task_id not in pending:
+                            continue
 
+                        values = task_values[task_id]
                         for change in object_set.changeSet:
-                            if change.name == 'info':
-                                task_state = change.val.state
-                            elif change.name == 'info.state':
-                                task_state = change.val
-                            else:
-                                continue
+                            values[change.name] = change.val
+
+                            if change.name == 'info.progress' and progress_callback and change.val is not None:
+                                progress_callback(pending[task_id], change.val)
+
+                        task_state = values.get('info.state')
+                        if task_state not in (vim.TaskInfo.State.success, vim.TaskInfo.State.error):
+                            continue
+
+                        task = pending.pop(task_id)
+                        yield TaskResult(task, result=values.get('info.result'), error=values.get('info.error'))
+
+        finally:
+            property_collector.DestroyPropertyCollector()
+
+    def _cancel_tasks(self, tasks):
+        for task in tasks:
+            try:
+                task.CancelTask()
+            except vmodl.MethodFault as e:
+                # Not every task is cancelable, or it may have completed in the meantime
+                logging.warning('failed to cancel task "{0}". {1}'.format(task, e))
+
+    def track(self, task, on_success=None):
+        """
+        Tracks a task in the background without blocking
+        :param on_success: called as on_success(result) when the task succeeds, before the future completes
+        :return: TaskFuture
+        """
+
+        # Tasks tracked from concurrent threads must share one tracker, others would never be stopped
+        with self._task_tracker_lock:
+            if self._task_tracker is None:
+                self._task_tracker = _TaskTracker(self)
+
+            task_tracker = self._task_tracker
+
+        return task_tracker.submit(task, on_success=on_success)
+
+    def _run_task(self, task, wait=True, on_success=None):
+        if not wait:
+            return self.track(task, on_success=on_success)
+
+        result = self.wait(task)
+        if on_success:
+            on_success(result)
+
+        return result
+
+    def wait_all(self, tasks):
+        """
+        Waits for all the given tasks to complete
+        :return: list of TaskResult, in the same order as the given tasks
+        """
+
+        tasks = list(tasks)
+        results = dict((x.task._moId, x) for x in self.iterate_task_results(tasks))
+        return [results[task._moId] for task in tasks]
+
+    def wait_any(self, tasks):
+        """
+        Waits for the first of the given tasks to complete
+        :return: TaskResult of the completed task
+        """
+
+        return next(self.iterate_task_results(tasks), None)
+
+    def power_on_many(self, virtual_machines, verify_state=True, max_workers=8):
+        """
+        Powers on many virtual machines at once, using Datacenter.PowerOnMultiVM_Task when the server supports it
+        :return: list of TaskResult, the target of each is the VirtualMachine
+        """
+
+        virtual_machines = list(virtual_machines)
+        results = []
+        if verify_state:
+            virtual_machines, results = self._refresh_power_states(virtual_machines)
+            virtual_machines = [x for x in virtual_machines if not x.is_powered_on()]
+
+        if virtual_machines:
+            results.extend(self._power_on_multi(virtual_machines, max_workers=max_workers))
+
+        for virtual_machine in virtual_machines:
+            virtual_machine._invalidate_power_state()
+
+        return results
+
+    def power_off_many(self, virtual_machines, verify_state=True, max_workers=8):
+        virtual_machines = list(virtual_machines)
+        results = []
+        if verify_state:
+            virtual_machines, results = self._refresh_power_states(virtual_machines)
+            virtual_machines = [x for x in virtual_machines if not x.is_powered_off()]
+
+        results.extend(self._run_tasks(virtual_machines, lambda x: x._raw_virtual_machine.PowerOffVM_Task(), max_workers=max_workers))
+
+        for virtual_machine in virtual_machines:
+            virtual_machine._invalidate_power_state()
+
+        return results
+
+    def reboot_many(self, virtual_machines, verify_state=True, max_workers=8):
+        virtual_machines = list(virtual_machines)
+        results = []
+        if verify_state:
+            # Only a running virtual machine can be reset
+            virtual_machines, results = self._refresh_power_states(virtual_machines)
+            virtual_machines = [x for x in virtual_machines if x.is_powered_on()]
 
-                            # Check if this task is our given task
-                            if str(current_task) != str(task):
-                                # Probably another task... Sometimes there's noise, we'll ignore it and move to the next one
+        results.extend(self._run_tasks(virtual_machines, lambda x: x._raw_virtual_machine.ResetVM_Task(), max_workers=max_workers))
+
+        for virtual_machine in virtual_machines:
+            virtual_machine._invalidate_power_state()
+
+        return results
+
+    def shutdown_many(self, virtual_machines, verify_state=True, max_workers=8):
+        virtual_machines = list(virtual_machines)
+        results = []
+        if verify_state:
+            virtual_machines, results = self._refresh_power_states(virtual_machines)
+            virtual_machines = [x for x in virtual_machines if not x.is_powered_off()]
+
+        def shutdown(virtual_machine):
+            # ShutdownGuest only requests the guest to shut down, there is no task to wait for
+            try:
+                virtual_machine._raw_virtual_machine.ShutdownGuest()
+                return TaskResult(None, target=virtual_machine)
+            except Exception as e:
+                return TaskResult(None, error=e, target=virtual_machine)
+            finally:
+                virtual_machine._invalidate_power_state()
+
+        return results + self._map_concurrently(shutdown, virtual_machines, max_workers)
+
+    def run_in_guests(self, virtual_machines, program_path, arguments="", credentials=None, working_directory='/', environment_variables=None, max_concurrency=32, timeout=None):
+        """
+        Runs the same program in many guests at once
+        :param credentials: (username, password) used to log in every guest. when omitted, each virtual machine's existing vmware tools login is used
+        :param max_concurrency: maximum number of guest processes running at the same time
+        :param timeout: seconds each process may run before it is terminated. waits forever by default
+        :return: generator of GuestProcessResult (target is the VirtualMachine), in order of completion
+        """
+
+        queue = list(virtual_machines)
+        queue.reverse()
+
+        # Starts and polls share a single pool, and are handled one by one as they complete
+        executor = futures.ThreadPoolExecutor(max_workers=max_concurrency)
+        in_flight = {}
+        running = {}
+
+        def start(virtual_machine):
+            if credentials:
+                virtual_machine.vmware_tools_login(*credentials)
+
+            pid = virtual_machine.vmware_tools_execute_process(program_path, working_directory, arguments=arguments, environment_variables=environment_variables)
+            return pid, time.time()
+
+        def poll(virtual_machine, pids):
+            # Retry briefly. a failing guest only holds its own poll, not the other ones
+            return virtual_machine.vmware_tools_list_processes(pids=pids, max_retries=2, retry_delay_seconds=1)
+
+        def terminate(virtual_machine, pid):
+            try:
+                self.get_guest_operations_manager().processManager.TerminateProcessInGuest(vm=virtual_machine._raw_virtual_machine,
+                                                                                           auth=virtual_machine._tools_credentials,
+                                                                                           pid=pid)
+            except vmodl.MethodFault as e:
+                logging.warning('failed to terminate guest process {0} of "{1}". {2}'.format(pid, virtual_machine.name, e))
+
+        try:
+            while queue or in_flight or running:
+                starting_count = len([x for x in in_flight.values() if x[0] == 'start'])
+                while queue and starting_count + sum(len(x['pids']) for x in running.values()) < max_concurrency:
+                    virtual_machine = queue.pop()
+                    in_flight[executor.submit(start, virtual_machine)] = ('start', virtual_machine, None)
+                    starting_count += 1
+
+                # A single ListProcessesInGuest call per virtual machine covers all of its pids, each one on its own backoff
+                now = time.time()
+                for state in running.values():
+                    if not state['polling'] and now >= state['next_poll']:
+                        pids = list(state['pids'])
+                        state['polling'] = True
+                        in_flight[executor.submit(poll, state['virtual_machine'], pids)] = ('poll', state, pids)
+
+                # Wait for a start or a poll to complete, or for the next poll to be due, whichever comes first
+                next_polls = [x['next_poll'] for x in running.values() if not x['polling']]
+                delay = max(0, min(next_polls) - time.time()) if next_polls else None
+                if in_flight:
+                    done, _ = futures.wait(list(in_flight), timeout=delay, return_when=futures.FIRST_COMPLETED)
+                else:
+                    time.sleep(delay or 0)
+                    done = []
+
+                for future in done:
+                    kind, item, polled_pids = in_flight.pop(future)
+
+                    if kind == 'start':
+                        virtual_machine = item
+                        try:
+                            pid, started_at = future.result()
+                        except Exception as e:
+                            yield GuestProcessResult(None, None, None, None, error=e, target=virtual_machine)
+                            continue
+
+                        state = running.get(id(virtual_machine))
+                        if state is None:
+                            backoff = _Backoff()
+                            state = running[id(virtual_machine)] = {'virtual_machine': virtual_machine, 'pids': {}, 'backoff': backoff,
+                                                                    'polling': False, 'next_poll': time.time() + backoff.next_delay()}
+
+                        state['pids'][pid] = started_at
+                        continue
+
+                    state = item
+                    virtual_machine = state['virtual_machine']
+                    pids = state['pids']
+                    state['polling'] = False
+
+                    error = future.exception()
+                    if error is not None:
+                        for pid in polled_pids:
+                            del pids[pid]
+                            yield GuestProcessResult(pid, None, None, None, error=error, target=virtual_machine)
+                    else:
+                        processes = dict((x.pid, x) for x in future.result())
+                        for pid in polled_pids:
+                            process = processes.get(pid)
+                            if process is None:
+                                del pids[pid]
+                                yield GuestProcessResult(pid, None, None, None, error=Exception('guest process {0} is missing'.format(pid)), target=virtual_machine)
+
+                            elif process.endTime is not None:
+                                del pids[pid]
+                                state['backoff'].reset()
+                                yield GuestProcessResult(pid, process.exitCode, process.startTime, process.endTime, target=virtual_machine)
+
+                    if timeout is not None:
+                        for pid, started_at in list(pids.items()):
+                            if time.time() - started_at < timeout:
                                 continue
 
-                            if task_state == vim.TaskInfo.State.success:
-                                return
-                            elif task_state == vim.TaskInfo.State.error:
-                                raise Exception(current_task.info.error)
-                            else:
-                                # Probably still in progress, ignore
-                                pass
+                            del pids[pid]
+                            terminate(virtual_machine, pid)
 
-                time.sleep(0.1)
+                            error = Exception('guest process {0} did not finish within {1} seconds and was terminated'.format(pid, timeout))
+                            yield GuestProcessResult(pid, None, None, None, error=error, target=virtual_machine)
+
+                    if pids:
+                        state['next_poll'] = time.time() + state['backoff'].next_delay()
+                    else:
+                        del running[id(virtual_machine)]
 
         finally:
-            if filter_instance:
-                filter_instance.Destroy()
+            executor.shutdown(wait=False)
 
-    def get_datastores(self):
+    def _refresh_power_states(self, virtual_machines):
+        """
+        Re-reads the power state of many virtual machines in a single call
+        :return: (list of the VirtualMachine that still exist, list of TaskResult of the missing ones)
+        """
+
+        return self._resolve_virtual_machines(virtual_machines, ['runtime.powerState'])
+
+    def _power_on_multi(self, virtual_machines, max_workers=8):
+        """
+        Powers on with a Datacenter.PowerOnMultiVM_Task per datacenter, a vCenter feature.
+        Virtual machines it does not handle (e.g. of a standalone ESXi host) are powered on one by one
+        :return: list of TaskResult, the target of each is the VirtualMachine
+        """
+
+        fallback = []
+        submitted = []
+        for datacenter, members in self._group_by_datacenter(virtual_machines):
+            if datacenter is None:
+                fallback.extend(members)
+                continue
+
+            try:
+                submitted.append((datacenter.PowerOnMultiVM_Task(vm=[x._raw_virtual_machine for x in members]), members))
+            except vmodl.MethodFault as e:
+                logging.info('PowerOnMultiVM_Task is not available, powering on one by one. {0}'.format(e))
+                fallback.extend(members)
+
+        results = []
+        attempted = []
+
+        for (_, members), task_result in zip(submitted, self.wait_all([task for task, _ in submitted])):
+            if not task_result.succeeded:
+                logging.info('PowerOnMultiVM_Task failed, powering on one by one. {0}'.format(task_result.error))
+                fallback.extend(members)
+                continue
+
+            virtual_machine_by_id = dict((x._raw_virtual_machine._moId, x) for x in members)
+
+            for attempted_power_on in task_result.result.attempted or []:
+                if attempted_power_on.task:
+                    attempted.append((attempted_power_on.task, virtual_machine_by_id.pop(attempted_power_on.vm._moId, None)))
+
+            for not_attempted in task_result.result.notAttempted or []:
+                virtual_machine = virtual_machine_by_id.pop(not_attempted.vm._moId, None)
+                if virtual_machine:
+                    results.append(TaskResult(None, error=not_attempted.fault, target=virtual_machine))
+
+            # Left with virtual machines the server only recommended (e.g. DRS in manual mode)
+            fallback.extend(virtual_machine_by_id.values())
+
+        if attempted:
+            attempted_targets = dict((task._moId, virtual_machine) for task, virtual_machine in attempted)
+            for attempted_result in self.wait_all([task for task, _ in attempted]):
+                attempted_result.target = attempted_targets[attempted_result.task._moId]
+                results.append(attempted_result)
+
+        results.extend(self._run_tasks(fallback, lambda x: x._raw_virtual_machine.PowerOnVM_Task(), max_workers=max_workers))
+        return results
+
+    def _group_by_datacenter(self, virtual_machines):
+        """
+        :return: list of (vim.Datacenter, list of VirtualMachine). virtual machines found in no datacenter are grouped under None
+        """
+
+        datacenters = [datacenter for datacenter, _ in self._retrieve_properties(vim.Datacenter, ['name'])]
+        if len(datacenters) == 1:
+            return [(datacenters[0], list(virtual_machines))]
+
+        virtual_machine_by_id = collections.OrderedDict((x._raw_virtual_machine._moId, x) for x in virtual_machines)
+        groups = []
+
+        for datacenter in datacenters:
+            if not virtual_machine_by_id:
+                break
+
+            items = self._retrieve_properties(vim.VirtualMachine, ['name'], container=datacenter)
+            members = [virtual_machine_by_id.pop(x._moId) for x, _ in items if x._moId in virtual_machine_by_id]
+            if members:
+                groups.append((datacenter, members))
+
+        if virtual_machine_by_id:
+            groups.append((None, list(virtual_machine_by_id.values())))
+
+        return groups
+
+    def _run_tasks(self, targets, create_task, max_workers=8):
+        """
+        Submits a task per target concurrently, then waits for all of them through a single filter
+        :param create_task: called as create_task(target), returns a vim.Task
+        :return: list of TaskResult, the target of each is set
+        """
+
+        def submit(target):
+            try:
+                return target, create_task(target), None
+            except Exception as e:
+                return target, None, e
+
+        submitted = self._map_concurrently(submit, targets, max_workers)
+
+        results = [TaskResult(None, error=error, target=target) for target, task, error in submitted if error is not None]
+        submitted = [(target, task) for target, task, error in submitted if error is None]
+
+        for (target, _), task_result in zip(submitted, self.wait_all([task for _, task in submitted])):
+            task_result.target = target
+            results.append(task_result)
+
+        return results
+
+    def _map_concurrently(self, function, items, max_workers):
+        items = list(items)
+        if len(items) <= 1 or max_workers <= 1:
+            return [function(x) for x in items]
+
+        executor = futures.ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+        try:
+            return list(executor.map(function, items))
+        finally:
+            executor.shutdown(wait=True)
+
+    def take_snapshots(self, virtual_machines, name, description="", memory=False, try_persist_disk=True, max_per_host=4, max_per_datastore=4, max_tasks=32):
+        """
+        Takes a snapshot of many virtual machines at once
+        :param virtual_machines: VirtualMachine objects and / or virtual machine names
+        :param max_per_host: maximum number of snapshot tasks running at the same time on each ESXi host
+        :param max_per_datastore: maximum number of snapshot tasks running at the same time on each datastore
+        :param max_tasks: maximum number of snapshot tasks running at the same time overall
+        :return: list of TaskResult in order of completion, the target of each is the VirtualMachine (or the name that could not be resolved)
+        """
 
-        # Search for all ESXi hosts
-        objview = self._content.viewManager.CreateContainerView(self._content.rootFolder, [vim.HostSystem], True)
-        esxi_hosts = objview.view
-        objview.Destroy()
+        targets, results = self._resolve_virtual_machines(virtual_machines, SNAPSHOT_PLACEMENT_PROPERTIES)
 
-        for esxi_host in esxi_hosts:
+        def create_task(virtual_machine):
+            return virtual_machine._raw_virtual_machine.CreateSnapshot(name, description, memory, try_persist_disk)
 
-            # All Filesystems on ESXi host
-            storage_system = esxi_host.configManager.storageSystem
-            if storage_system.fileSystemVolumeInfo is None:
+        results.extend(self._run_throttled_tasks(targets, create_task, max_per_host, max_per_datastore, max_tasks))
+        return results
+
+    def revert_snapshots(self, virtual_machines, snapshot_name, max_per_host=4, max_per_datastore=4, max_tasks=32):
+        """
+        Reverts many virtual machines to their snapshot of the given name at once
+        :return: list of TaskResult in order of completion. a virtual machine without such a snapshot is reported as a failure
+        """
+
+        targets, results = self._resolve_virtual_machines(virtual_machines, SNAPSHOT_TARGET_PROPERTIES)
+        targets, snapshots, missing = self._resolve_snapshots(targets, snapshot_name)
+        results.extend(missing)
+
+        def create_task(virtual_machine):
+            virtual_machine._invalidate_power_state()
+            return snapshots[id(virtual_machine)]._raw_snapshot.snapshot.RevertToSnapshot_Task()
+
+        results.extend(self._run_throttled_tasks(targets, create_task, max_per_host, max_per_datastore, max_tasks))
+        return results
+
+    def remove_snapshots(self, virtual_machines, snapshot_name=None, remove_children=True, consolidate=True, max_per_host=4, max_per_datastore=4, max_tasks=32):
+        """
+        Removes a snapshot of many virtual machines at once
+        :param snapshot_name: snapshot to remove. when omitted, all snapshots are removed
+        :return: list of TaskResult in order of completion. a virtual machine without such a snapshot is reported as a failure
+        """
+
+        # Removing all snapshots does not need to read the snapshot hierarchy
+        path_set = SNAPSHOT_PLACEMENT_PROPERTIES if snapshot_name is None else SNAPSHOT_TARGET_PROPERTIES
+        targets, results = self._resolve_virtual_machines(virtual_machines, path_set)
+
+        if snapshot_name is None:
+            def create_task(virtual_machine):
+                return virtual_machine._raw_virtual_machine.RemoveAllSnapshots_Task(consolidate)
+        else:
+            targets, snapshots, missing = self._resolve_snapshots(targets, snapshot_name)
+            results.extend(missing)
+
+            def create_task(virtual_machine):
+                return snapshots[id(virtual_machine)]._raw_snapshot.snapshot.RemoveSnapshot_Task(remove_children, consolidate)
+
+        results.extend(self._run_throttled_tasks(targets, create_task, max_per_host, max_per_datastore, max_tasks))
+        return results
+
+    def _resolve_virtual_machines(self, virtual_machines, path_set):
+        """
+        Resolves a selection of VirtualMachine objects and / or names, then reads the given properties of all of them in a single call
+        :return: (list of VirtualMachine, list of TaskResult of the targets that could not be resolved)
+        """
+
+        virtual_machines = list(virtual_machines)
+        failures = []
+
+        names = [x for x in virtual_machines if not isinstance(x, VirtualMachine)]
+        index = self._get_virtual_machine_index() if names else {}
+        if any(x not in index for x in names):
+            index = self._get_virtual_machine_index(rebuild=True)
+
+        resolved = collections.OrderedDict()
+        for virtual_machine in virtual_machines:
+            if isinstance(virtual_machine, VirtualMachine):
+                raw_virtual_machine = virtual_machine._raw_virtual_machine
+            elif virtual_machine in index:
+                raw_virtual_machine = index[virtual_machine]
+            else:
+                failures.append(TaskResult(None, error=Exception('virtual machine "{0}" does not exist'.format(virtual_machine)), target=virtual_machine))
+                continue
+
+            resolved.setdefault(raw_virtual_machine._moId, (virtual_machine, raw_virtual_machine))
+
+        try:
+            items = self._retrieve_properties(vim.VirtualMachine, path_set, objects=[x for _, x in resolved.values()])
+        except vmodl.fault.ManagedObjectNotFound:
+            # One of them is gone, read them one by one so it does not fail the others
+            items = []
+            for virtual_machine, raw_virtual_machine in list(resolved.values()):
+                try:
+                    items.extend(self._retrieve_properties(vim.VirtualMachine, path_set, objects=[raw_virtual_machine]))
+                except vmodl.fault.ManagedObjectNotFound:
+                    name = virtual_machine.name if isinstance(virtual_machine, VirtualMachine) else virtual_machine
+                    failures.append(TaskResult(None, error=Exception('Virtual Machine "{}" is missing'.format(name)), target=virtual_machine))
+
+        targets = []
+        for raw_virtual_machine, properties in items:
+            virtual_machine, _ = resolved[raw_virtual_machine._moId]
+            if isinstance(virtual_machine, VirtualMachine):
+                virtual_machine._properties.update(properties)
+            else:
+                virtual_machine = VirtualMachine(self, raw_virtual_machine, properties)
+
+            targets.append(virtual_machine)
+
+        return targets, failures
+
+    def _resolve_snapshots(self, virtual_machines, snapshot_name):
+        # Relies on the "snapshot" property read by _resolve_virtual_machines, no further calls per virtual machine
+        targets = []
+        snapshots = {}
+        failures = []
+
+        for virtual_machine in virtual_machines:
+            snapshot = SnapshotTree(self, virtual_machine._properties.get('snapshot')).get_by_name(snapshot_name)
+            if snapshot is None:
+                error = Exception('virtual machine "{0}" does not have a snapshot named "{1}"'.format(virtual_machine.name, snapshot_name))
+                failures.append(TaskResult(None, error=error, target=virtual_machine))
                 continue
-                
-            host_file_sys_vol_mount_info = storage_system.fileSystemVolumeInfo.mountInfo
 
-            for host_mount_info in host_file_sys_vol_mount_info:
+            targets.append(virtual_machine)
+            snapshots[id(virtual_machine)] = snapshot
+
+        return targets, snapshots, failures
+
+    def _run_throttled_tasks(self, virtual_machines, create_task, max_per_host, max_per_datastore, max_tasks):
+        """
+        Runs a task per virtual machine, keeping the number of tasks in flight on each ESXi host and on each datastore under a limit.
+        Relies on the "runtime.host" and "datastore" properties, as read by _resolve_virtual_machines
+        :param create_task: called as create_task(virtual_machine), returns a vim.Task
+        :return: list of TaskResult in order of completion, the target of each is the VirtualMachine
+        """
+
+        if min(max_per_host, max_per_datastore, max_tasks) < 1:
+            raise Exception('concurrency limits must be at least 1')
+
+        pending = list(virtual_machines)
+        running = {}
+        in_flight = collections.Counter()
+        results = []
+
+        def get_limits(virtual_machine):
+            limits = []
+
+            host = virtual_machine._properties.get('runtime.host')
+            if host is not None:
+                limits.append((('host', host._moId), max_per_host))
+
+            for datastore in virtual_machine._properties.get('datastore') or []:
+                limits.append((('datastore', datastore._moId), max_per_datastore))
+
+            return limits
 
-                # Extract only VMFS volumes
-                if host_mount_info.volume.type != "VMFS":
+        while pending or running:
+            waiting = []
+            for virtual_machine in pending:
+                limits = get_limits(virtual_machine)
+                if len(running) >= max_tasks or any(in_flight[key] >= limit for key, limit in limits):
+                    waiting.append(virtual_machine)
                     continue
 
-                datastore = {
-                    'name': host_mount_info.volume.name,
-                    'disks': [item.diskName for item in host_mount_info.volume.extent],
-                    'uuid': host_mount_info.volume.uuid,
-                    'capacity': host_mount_info.volume.capacity,
-                    'vmfs_version': host_mount_info.volume.version,
-                    'local': host_mount_info.volume.local,
-                    'ssd': host_mount_info.volume.ssd
-                }
+                try:
+                    task = create_task(virtual_machine)
+                except Exception as e:
+                    results.append(TaskResult(None, error=e, target=virtual_machine))
+                    continue
+
+                for key, _ in limits:
+                    in_flight[key] += 1
+
+                running[self.track(task)] = (virtual_machine, limits)
+
+            pending = waiting
+            if not running:
+                continue
+
+            done, _ = futures.wait(list(running), return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                virtual_machine, limits = running.pop(future)
+                for key, _ in limits:
+                    in_flight[key] -= 1
+
+                # The snapshot hierarchy has changed, a later read must not use the stale one
+                virtual_machine._properties.pop('snapshot', None)
 
-                yield datastore
+                error = future.exception()
+                results.append(TaskResult(future.task, result=None if error else future.result(), error=error, target=virtual_machine))
+
+        return results
+
+    def get_datastores(self):
+        """
+        Lists all datastores (VMFS, NFS, vSAN, ...), read in a single call and cached for datastore_cache_seconds
+        :return: generator of dicts
+        """
+
+        for datastore in self._get_datastores():
+            yield dict(datastore)
+
+    def _get_datastores(self):
+        if self._datastores is None or time.time() >= self._datastores_expiration:
+            items = self._retrieve_properties(vim.Datastore, DATASTORE_PROPERTIES)
+            host_names = dict((esxi_host._moId, properties['name']) for esxi_host, properties in self._retrieve_properties(vim.HostSystem, ['name']))
+
+            self._datastores = [self._parse_datastore(properties, host_names) for _, properties in items]
+            self._datastores_expiration = time.time() + self.datastore_cache_seconds
+
+        return self._datastores
+
+    @staticmethod
+    def _parse_datastore(properties, host_names):
+        summary = properties['summary']
+
+        # Only VMFS datastores describe their volume
+        volume = getattr(properties['info'], 'vmfs', None)
+
+        return {
+            'name': summary.name,
+            'disks': [item.diskName for item in volume.extent] if volume else [],
+            'uuid': volume.uuid if volume else None,
+            'capacity': summary.capacity,
+            'free_space': summary.freeSpace,
+            'type': summary.type,
+            'accessible': summary.accessible,
+            'url': summary.url,
+            'hosts': [host_names.get(host_mount.key._moId) for host_mount in properties['host'] or []],
+            'vmfs_version': volume.version if volume else None,
+            'local': volume.local if volume else None,
+            'ssd': volume.ssd if volume else None
+        }
 
     def set_server_datetime(self, new_value=None):
 
@@ -192,12 +1077,12 @@ class VMWareClient(object):
             new_value = datetime.datetime.now()
 
         esxi_host = self._get_single_esxi_host()
-        date_time_manager = esxi_host.configManager.dateTimeSystem
+        date_time_manager = esxi_host.date_time_system
         date_time_manager.UpdateDateTime(new_value)
 
     def get_server_datetime(self):
         esxi_host = self._get_single_esxi_host()
-        date_time_manager = esxi_host.configManager.dateTimeSystem
+        date_time_manager = esxi_host.date_time_system
         return date_time_manager.QueryDateTime()
 
     def get_licenses(self):
@@ -219,13 +1104,9 @@ class VMWareClient(object):
 
     def get_services(self):
 
-        objview = self._content.viewManager.CreateContainerView(self._content.rootFolder, [vim.HostSystem], True)
-        esxi_hosts = objview.view
-        objview.Destroy()
-
-        for esxi_host in esxi_hosts:
+        for esxi_host in self._get_esxi_hosts():
 
-            service_system = esxi_host.configManager.serviceSystem
+            service_system = esxi_host.service_system
             services = service_system.serviceInfo.service
 
             for service in services:
@@ -239,32 +1120,20 @@ class VMWareClient(object):
 
     def start_service(self, service_id):
 
-        objview = self._content.viewManager.CreateContainerView(self._content.rootFolder, [vim.HostSystem], True)
-        esxi_hosts = objview.view
-        objview.Destroy()
-
-        for esxi_host in esxi_hosts:
-            service_system = esxi_host.configManager.serviceSystem
+        for esxi_host in self._get_esxi_hosts():
+            service_system = esxi_host.service_system
             service_system.StartService(service_id)
 
     def restart_service(self, service_id):
 
-        objview = self._content.viewManager.CreateContainerView(self._content.rootFolder, [vim.HostSystem], True)
-        esxi_hosts = objview.view
-        objview.Destroy()
-
-        for esxi_host in esxi_hosts:
-            service_system = esxi_host.configManager.serviceSystem
+        for esxi_host in self._get_esxi_hosts():
+            service_system = esxi_host.service_system
             service_system.RestartService(service_id)
 
     def stop_service(self, service_id):
 
-        objview = self._content.viewManager.CreateContainerView(self._content.rootFolder, [vim.HostSystem], True)
-        esxi_hosts = objview.view
-        objview.Destroy()
-
-        for esxi_host in esxi_hosts:
-            service_system = esxi_host.configManager.serviceSystem
+        for esxi_host in self._get_esxi_hosts():
+            service_system = esxi_host.service_system
             service_system.StopService(service_id)
 
     def enable_ssh(self):
@@ -275,36 +1144,57 @@ class VMWareClient(object):
         service_id = 'TSM-SSH'
         self.stop_service(service_id)
 
-    def _get_single_esxi_host(self):
-        objview = self._content.viewManager.CreateContainerView(self._content.rootFolder, [vim.HostSystem], True)
-        esxi_hosts = objview.view
-        objview.Destroy()
+    def _get_esxi_hosts(self):
+        if self._esxi_hosts is None:
+            items = self._retrieve_properties(vim.HostSystem, HOST_REFERENCE_PROPERTIES)
+            self._esxi_hosts = [_EsxiHost(esxi_host, properties) for esxi_host, properties in items]
 
-        for esxi_host in esxi_hosts:
+        return self._esxi_hosts
+
+    def _get_single_esxi_host(self):
+        for esxi_host in self._get_esxi_hosts():
             return esxi_host
 
     def get_physical_interfaces(self):
 
         esxi_host = self._get_single_esxi_host()
-        for pnic in esxi_host.config.network.pnic:
-            yield pnic.device
+        for _, properties in self._retrieve_properties(vim.HostSystem, ['config.network.pnic'], objects=[esxi_host.raw]):
+            for pnic in properties['config.network.pnic'] or []:
+                yield pnic.device
 
     def _iterate_virtual_switches(self):
         esxi_host = self._get_single_esxi_host()
-        for vswitch in esxi_host.config.network.vswitch:
-            yield vswitch
+        for _, properties in self._retrieve_properties(vim.HostSystem, ['config.network.vswitch'], objects=[esxi_host.raw]):
+            for vswitch in properties['config.network.vswitch'] or []:
+                yield vswitch
+
+    def get_managed_object(self, obj_type, name):
+        """
+        Resolves a managed object reference by name. all names of a type are read in a single call, then cached until invalidate_caches()
+        :param obj_type: one of RESOLVABLE_TYPES, e.g. vim.Network
+        :return: the managed object, or None. when names repeat (e.g. resource pools of different hosts) the first one found is returned
+        """
+
+        managed_object = self._get_managed_object_index(obj_type).get(name)
+        if managed_object is None:
+            # Might have been created after the index was built
+            managed_object = self._get_managed_object_index(obj_type, rebuild=True).get(name)
 
-    def _get_datastore_reference(self, name):
+        return managed_object
 
-        objview = self._content.viewManager.CreateContainerView(self._content.rootFolder, [vim.Datastore], True)
-        datastore = None
-        for item in objview.view:
-            if item.name == name:
-                datastore = item
+    def _get_managed_object_index(self, obj_type, rebuild=False):
+        if obj_type not in RESOLVABLE_TYPES:
+            raise Exception('managed objects of type "{0}" cannot be resolved by name'.format(obj_type.__name__))
 
-        objview.Destroy()
+        index = self._managed_object_indexes.get(obj_type)
+        if index is None or rebuild:
+            index = {}
+            for managed_object, properties in self._retrieve_properties(obj_type, ['name']):
+                index.setdefault(properties['name'], managed_object)
 
-        return datastore
+            self._managed_object_indexes[obj_type] = index
+
+        return index
 
     def new_virtual_machine(self, name, remove_existing=False, cpus=1, ram_mb=512, datastore_name=None, vm_version=8, operating_system_type='ubuntu64Guest', thin_provision=True, disk_size_gb=100, network_name='VM Network', mac_address=None):
         """
@@ -318,7 +1208,7 @@ class VMWareClient(object):
         :return:
         """
 
-        existing_virtual_machine = next((x for x in self.get_virtual_machines() if x.name == name), None)
+        existing_virtual_machine = self.get_virtual_machine(name)
 
         if existing_virtual_machine:
 
@@ -327,17 +1217,119 @@ class VMWareClient(object):
             else:
                 raise Exception('virtual machine "{0}" already exist'.format(existing_virtual_machine.name))
 
-        datacenter = self._content.rootFolder.childEntity[0]
+        vm_folder, resource_pool = self._get_default_placement()
 
         if not datastore_name:
             datastore_name = self._get_first_datastore_name()
 
+        config = self._new_virtual_machine_config(name, cpus=cpus, ram_mb=ram_mb, datastore_name=datastore_name, vm_version=vm_version,
+                                                  operating_system_type=operating_system_type, thin_provision=thin_provision,
+                                                  disk_size_gb=disk_size_gb, network_name=network_name, mac_address=mac_address)
+
+        # The task result is the new virtual machine reference
+        raw_virtual_machine = self.wait(vm_folder.CreateVM_Task(config=config, pool=resource_pool))
+        if self._virtual_machine_index is not None:
+            self._virtual_machine_index[name] = raw_virtual_machine
+
+        return self._load_virtual_machine(raw_virtual_machine)
+
+    def new_virtual_machines(self, specs, remove_existing=False, max_workers=8):
+        """
+        Creates many virtual machines at once
+        :param specs: dicts of new_virtual_machine arguments, e.g. [{'name': 'vm-1', 'cpus': 2}, {'name': 'vm-2', 'network_name': 'Lab'}]
+        :param remove_existing: delete virtual machines that already exist with one of the names. otherwise these specs fail
+        :param max_workers: maximum number of CreateVM_Task calls submitted at the same time
+        :return: list of TaskResult in the order of specs. the target of each is the name, the result is the new VirtualMachine
+        """
+
+        specs = [dict(x) for x in specs]
+        results = [None] * len(specs)
+
+        # A single inventory read validates all of the names
+        index = self._get_virtual_machine_index(rebuild=True)
+
+        names = set()
+        existing = {}
+        for i, spec in enumerate(specs):
+            name = spec.get('name')
+            if name in names:
+                results[i] = TaskResult(None, error=Exception('virtual machine "{0}" is specified more than once'.format(name)), target=name)
+            elif name in index and not remove_existing:
+                results[i] = TaskResult(None, error=Exception('virtual machine "{0}" already exist'.format(name)), target=name)
+            elif name in index:
+                existing[i] = index[name]
+
+            names.add(name)
+
+        for task_result in self._run_tasks(list(existing), lambda i: existing[i].Destroy_Task(), max_workers=max_workers):
+            if task_result.succeeded:
+                index.pop(specs[task_result.target]['name'], None)
+            else:
+                results[task_result.target] = TaskResult(task_result.task, error=task_result.error, target=specs[task_result.target]['name'])
+
+        pending = [i for i, x in enumerate(results) if x is None]
+        if not pending:
+            return results
+
+        # References shared by all of the new virtual machines are resolved once
+        vm_folder, resource_pool = self._get_default_placement()
+        default_datastore_name = None
+        if any(not specs[i].get('datastore_name') for i in pending):
+            default_datastore_name = self._get_first_datastore_name()
+
+        networks = {}
+        configs = {}
+        for i in pending:
+            spec = dict(specs[i])
+            spec.pop('remove_existing', None)
+            spec['datastore_name'] = spec.get('datastore_name') or default_datastore_name
+
+            network_name = spec.get('network_name', 'VM Network')
+            if network_name not in networks:
+                # Misses are cached as well, a missing network is looked up once and not once per spec
+                networks[network_name] = self.get_managed_object(vim.Network, network_name)
+
+            try:
+                if networks[network_name] is None:
+                    raise Exception('network "{0}" does not exist'.format(network_name))
+
+                configs[i] = self._new_virtual_machine_config(network=networks[network_name], **spec)
+            except Exception as e:
+                results[i] = TaskResult(None, error=e, target=spec.get('name'))
+
+        task_results = self._run_tasks(sorted(configs), lambda i: vm_folder.CreateVM_Task(config=configs[i], pool=resource_pool), max_workers=max_workers)
+        self._collect_created_virtual_machines(task_results, {i: specs[i]['name'] for i in configs}, results)
+        return results
+
+    def _collect_created_virtual_machines(self, task_results, names, results):
+        # Each task targets an index in results. The task result is the new virtual machine reference,
+        # all of the new virtual machines are loaded with a single properties read
+        created = {}
+        for task_result in task_results:
+            i = task_result.target
+            task_result.target = names[i]
+            results[i] = task_result
+
+            if task_result.succeeded:
+                created[task_result.result._moId] = i
+                if self._virtual_machine_index is not None:
+                    self._virtual_machine_index[names[i]] = task_result.result
+
+        for virtual_machine in self._load_virtual_machines(results[i].result for i in created.values()):
+            results[created[virtual_machine._raw_virtual_machine._moId]].result = virtual_machine
+
+    def _get_default_placement(self):
+        # New virtual machines go to the first datacenter, in the resource pool of its first host
+        datacenter = self._content.rootFolder.childEntity[0]
+        hosts = datacenter.hostFolder.childEntity
+        return datacenter.vmFolder, hosts[0].resourcePool
+
+    def _new_virtual_machine_config(self, name, cpus=1, ram_mb=512, datastore_name=None, vm_version=8, operating_system_type='ubuntu64Guest', thin_provision=True, disk_size_gb=100, network_name='VM Network', mac_address=None, network=None):
+
         # Workaround - It has an issue with '.' for some reason...
         vm_directory_name = name.replace('.', '-')
 
         datastore_path = '[{datastore_name}] {vm_directory_name}'.format(datastore_name=datastore_name, vm_directory_name=vm_directory_name)
-        hosts = datacenter.hostFolder.childEntity
-        resource_pool = hosts[0].resourcePool
 
         vmx_file = vim.vm.FileInfo(logDirectory=None,
                                    snapshotDirectory=None,
@@ -353,30 +1345,18 @@ class VMWareClient(object):
 
         unit_number = 0
 
-        scsi, scsi_controller_key = self._add_new_scsi_controller('SCSI-001')
-        disk = self._add_new_hard_disk('DISK-001', disk_size_gb, unit_number=unit_number, controller_key=scsi_controller_key, thin_provision=thin_provision, datastore_path=datastore_path, vm_name=name)
-        nic = self._add_new_network_interface(network_name, mac_address=mac_address)
+        device_keys = _DeviceKeyAllocator()
+        scsi, scsi_controller_key = self._add_new_scsi_controller(device_keys, 'SCSI-001')
+        disk = self._add_new_hard_disk(device_keys, 'DISK-001', disk_size_gb, unit_number=unit_number, controller_key=scsi_controller_key, thin_provision=thin_provision, datastore_path=datastore_path, vm_name=name)
+        nic = self._add_new_network_interface(device_keys, network_name, mac_address=mac_address, network=network)
 
         config.deviceChange = [scsi, disk, nic]
-
-        task = datacenter.vmFolder.CreateVM_Task(config=config, pool=resource_pool)
-        self.wait(task)
         # -----------------------------------
 
-        # Retrieve Virtual Machine by name (it's unique on a single ESXi server)
-        virtual_machine = next((x for x in self.get_virtual_machines() if x.name == name), None)
-        return virtual_machine
-
-    def _get_property(self, obj_type, name):
-        container = self._content.viewManager.CreateContainerView(self._content.rootFolder, [obj_type], True)
-        for item in container.view:
-            if item.name == name:
-                return item
-
-        return None
+        return config
 
-    def _add_new_network_interface(self, network_name, adapter_type='vmxnet3', connect_on_power_on=True, connected=True, wake_on_lan_enabled=False, mac_address=None):
-        key = random.randint(-4099, -4000)
+    def _add_new_network_interface(self, device_keys, network_name, adapter_type='vmxnet3', connect_on_power_on=True, connected=True, wake_on_lan_enabled=False, mac_address=None, network=None):
+        key = device_keys.allocate()
 
         network_spec = vim.vm.device.VirtualDeviceSpec()
         network_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
@@ -401,7 +1381,9 @@ class VMWareClient(object):
             network_spec.device.macAddress = mac_address
         network_spec.device.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo()
         network_spec.device.backing.deviceName = network_name
-        network_spec.device.backing.network = self._get_property(vim.Network, network_name)
+        network_spec.device.backing.network = network or self.get_managed_object(vim.Network, network_name)
+        if network_spec.device.backing.network is None:
+            raise Exception('network "{0}" does not exist'.format(network_name))
         network_spec.device.wakeOnLanEnabled = wake_on_lan_enabled
         network_spec.device.connectable = vim.vm.device.VirtualDevice.ConnectInfo()
         network_spec.device.connectable.connected = connected
@@ -409,415 +1391,1853 @@ class VMWareClient(object):
 
         return network_spec
 
-    def _add_new_scsi_controller(self, scsi_controller_label, bus_number=0, bus_sharing=None, adapter_type='lsilogic_sas'):
+    def _add_new_scsi_controller(self, device_keys, scsi_controller_label, bus_number=0, bus_sharing=None, adapter_type='lsilogic_sas'):
+
+        key = device_keys.allocate()
+
+        scsi_spec = vim.vm.device.VirtualDeviceSpec()
+
+        if adapter_type == "lsilogic":
+            summary = "LSI Logic"
+            scsi_spec.device = vim.vm.device.VirtualLsiLogicController()
+        elif adapter_type == "lsilogic_sas":
+            summary = "LSI Logic Sas"
+            scsi_spec.device = vim.vm.device.VirtualLsiLogicSASController()
+        elif adapter_type == "paravirtual":
+            summary = "VMware paravirtual SCSI"
+            scsi_spec.device = vim.vm.device.ParaVirtualSCSIController()
+        else:
+            # If type not specified or does not match, show error and return
+            if not adapter_type:
+                err_msg = "The type of '{0}' has not been specified".format(scsi_controller_label)
+            else:
+                err_msg = "Cannot create '{0}'. Invalid/unsupported type '{1}'".format(scsi_controller_label, adapter_type)
+            raise Exception(err_msg)
+
+        scsi_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+
+        scsi_spec.device.key = key
+        scsi_spec.device.busNumber = bus_number
+        scsi_spec.device.deviceInfo = vim.Description()
+        scsi_spec.device.deviceInfo.label = scsi_controller_label
+        scsi_spec.device.deviceInfo.summary = summary
+
+        if bus_sharing == "virtual":
+            scsi_spec.device.sharedBus = vim.vm.device.VirtualSCSIController.Sharing.virtualSharing
+
+        elif bus_sharing == "physical":
+            scsi_spec.device.sharedBus = vim.vm.device.VirtualSCSIController.Sharing.physicalSharing
+
+        else:
+            scsi_spec.device.sharedBus = vim.vm.device.VirtualSCSIController.Sharing.noSharing
+
+        return scsi_spec, key
+
+    def _add_new_hard_disk(self, device_keys, disk_label, size_gb, unit_number, controller_key=1000, thin_provision=True, datastore_path=None, vm_name=None):
+
+        key = device_keys.allocate()
+
+        size_kb = int(size_gb * 1024.0 * 1024.0)
+
+        disk_spec = vim.vm.device.VirtualDeviceSpec()
+        disk_spec.fileOperation = 'create'
+        disk_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+
+        disk_spec.device = vim.vm.device.VirtualDisk()
+        disk_spec.device.key = key
+        disk_spec.device.deviceInfo = vim.Description()
+        disk_spec.device.deviceInfo.label = disk_label
+        disk_spec.device.deviceInfo.summary = "{0} GB".format(size_gb)
+
+        disk_spec.device.backing = vim.vm.device.VirtualDisk.FlatVer2BackingInfo()
+        disk_spec.device.backing.thinProvisioned = thin_provision
+        disk_spec.device.backing.diskMode = 'persistent'
+
+        # Without a path, the disk is created in the directory of the virtual machine
+        if datastore_path:
+            disk_spec.device.backing.fileName = '{datastore_path}/{disk_label}.vmdk'.format(datastore_path=datastore_path, disk_label=disk_label)
+
+        disk_spec.device.controllerKey = controller_key
+        disk_spec.device.unitNumber = unit_number
+        disk_spec.device.capacityInKB = size_kb
+
+        return disk_spec
+
+    def get_virtual_switches(self):
+        virtual_switches = [VirtualSwitch(self, x) for x in self._iterate_virtual_switches()]
+        self._virtual_switch_index = dict((x.name, x) for x in virtual_switches)
+
+        for virtual_switch in virtual_switches:
+            yield virtual_switch
+
+    def ensure_virtual_switch_exists(self, name):
+        if not self.get_virtual_switch(name):
+            self.new_virtual_switch(name)
+
+    def get_virtual_switch(self, name):
+        if self._virtual_switch_index is None:
+            self._virtual_switch_index = dict((x.name, x) for x in self.get_virtual_switches())
+
+        return self._virtual_switch_index.get(name)
+
+    def get_virtual_machine(self, name):
+        inventory_mirror = self._get_ready_inventory_mirror()
+        if inventory_mirror:
+            virtual_machine = next((x for x in self.get_virtual_machines() if x.name == name), None)
+            return virtual_machine
+
+        raw_virtual_machine = self._get_virtual_machine_index().get(name)
+        virtual_machine = self._load_virtual_machine(raw_virtual_machine)
+
+        # Either unknown or stale (deleted / renamed since indexed), rebuild the index once
+        if not virtual_machine or virtual_machine.name != name:
+            raw_virtual_machine = self._get_virtual_machine_index(rebuild=True).get(name)
+            virtual_machine = self._load_virtual_machine(raw_virtual_machine)
+
+        return virtual_machine
+
+    def get_virtual_machine_by_uuid(self, uuid):
+        raw_virtual_machine = self._content.searchIndex.FindByUuid(None, uuid, True)
+        return self._load_virtual_machine(raw_virtual_machine)
+
+    def new_virtual_switch(self, name, vlan_id=4095, num_ports=128, mtu=4096, allow_promiscuous=True, allow_mac_changes=True, allow_forged_transmits=True):
+
+        # Ensure that a virtual switch does not exists
+        existing_virtual_switch = self.get_virtual_switch(name)
+
+        if existing_virtual_switch:
+            raise Exception('virtual switch "{0}" already exist. id "{1}"'.format(existing_virtual_switch.name, existing_virtual_switch.id))
+
+        vss_spec = vim.host.VirtualSwitch.Specification()
+
+        vss_spec.numPorts = num_ports
+        vss_spec.mtu = mtu
+
+        esxi_host = self._get_single_esxi_host()
+
+        virtual_switch_names = set(x.id for x in self.get_virtual_switches())
+        virtual_switch_name = next('vSwitch{0}'.format(i) for i in range(0, num_ports) if 'vSwitch{0}'.format(i) not in virtual_switch_names)
+
+        esxi_host.network_system.AddVirtualSwitch(vswitchName=virtual_switch_name, spec=vss_spec)
+
+        port_group_spec = vim.host.PortGroup.Specification()
+        port_group_spec.name = name
+        port_group_spec.vlanId = vlan_id
+        port_group_spec.vswitchName = virtual_switch_name
+
+        port_group_spec.policy = vim.host.NetworkPolicy()
+        port_group_spec.policy.security = vim.host.NetworkPolicy.SecurityPolicy()
+        port_group_spec.policy.security.allowPromiscuous = allow_promiscuous
+        port_group_spec.policy.security.forgedTransmits = allow_forged_transmits
+        port_group_spec.policy.security.macChanges = allow_mac_changes
+
+        esxi_host.network_system.AddPortGroup(portgrp=port_group_spec)
+
+        self._virtual_switch_index = None
+        virtual_switch = self.get_virtual_switch(name)
+        virtual_switch.update(allow_promiscuous=allow_promiscuous, allow_mac_changes=allow_mac_changes, allow_forged_transmits=allow_forged_transmits)
+        return virtual_switch
+
+    def _get_first_datastore_name(self):
+        datastores = [x for x in self._get_datastores() if x['accessible']]
+
+        if not datastores:
+            raise Exception('There are no datastores available')
+
+        # Place on the datastore with the most free space
+        return max(datastores, key=lambda x: x['free_space'] or 0)['name']
+
+    def get_guest_operations_manager(self):
+        return self._content.guestOperationsManager
+
+
+class FleetClient(object):
+    """
+    Many VMWareClient sessions at once, e.g. a fleet of standalone ESXi hosts.
+    Queries fan out to all the hosts in parallel and their results are merged into a single stream of (host, item) tuples.
+    Hosts that fail or do not respond within the timeout are recorded in errors and skipped, without stalling the others.
+    """
+
+    def __init__(self, hosts, username=None, password=None, port=443, verify=False, max_workers=10, timeout=None, connection_timeout=None):
+        """
+        :param hosts: host names sharing the given credentials, or (host, username, password) tuples
+        :param max_workers: maximum number of hosts queried concurrently
+        :param timeout: seconds to wait for all the hosts on each call. waits forever by default
+        :param connection_timeout: socket timeout of each host's connection, so a dead host does not hold a worker forever. requires pyvmomi 6.7.1+
+        """
+
+        self.clients = []
+        for host in hosts:
+            if isinstance(host, (tuple, list)):
+                host, host_username, host_password = host
+            else:
+                host_username, host_password = username, password
+
+            self.clients.append(VMWareClient(host, host_username, host_password, port=port, verify=verify, connection_timeout=connection_timeout))
+
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.errors = {}
+        self._executor = None
+
+    def __enter__(self):
+        self._executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+
+        clients = self.clients
+        self.clients = []
+
+        # A host that connects after the timeout is not used, its session is logged out instead of leaking
+        for client, _ in self._iterate_results(clients, lambda x: [x.__enter__()], cleanup=lambda x: x.__exit__(None, None, None)):
+            self.clients.append(client)
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        try:
+            for _ in self._iterate_results(self.clients, lambda x: x.__exit__(type, value, traceback) or []):
+                pass
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def map(self, function):
+        """
+        Runs function(client) on every host in parallel
+        :return: generator of (host, item) tuples for every item function(client) returns, as soon as each host is done
+        """
+
+        for client, item in self._iterate_results(self.clients, function):
+            yield client.host, item
+
+    def _iterate_results(self, clients, function, cleanup=None):
+        """
+        :param cleanup: called as cleanup(client) when function(client) succeeds only after the timeout has expired
+        """
+
+        pending = dict((self._executor.submit(lambda x: list(function(x)), client), client) for client in clients)
+
+        try:
+            for future in futures.as_completed(list(pending), timeout=self.timeout):
+                client = pending.pop(future)
+
+                error = future.exception()
+                if error is not None:
+                    logging.warning('host "{0}" failed. {1}'.format(client.host, error))
+                    self.errors[client.host] = error
+                    continue
+
+                self.errors.pop(client.host, None)
+                for item in future.result():
+                    yield client, item
+
+        except futures.TimeoutError:
+            for future, client in pending.items():
+                if not future.cancel() and cleanup:
+                    # Already running, it cannot be interrupted. clean up whatever it ends up with
+                    future.add_done_callback(lambda x, client=client: self._cleanup_late_result(x, client, cleanup))
+
+                logging.warning('host "{0}" did not respond within {1} seconds'.format(client.host, self.timeout))
+                self.errors[client.host] = Exception('timed out after {0} seconds'.format(self.timeout))
+
+    @staticmethod
+    def _cleanup_late_result(future, client, cleanup):
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        try:
+            cleanup(client)
+        except Exception as e:
+            logging.warning('failed to clean up host "{0}" after it timed out. {1}'.format(client.host, e))
+
+    def get_virtual_machines(self):
+        return self.map(lambda x: x.get_virtual_machines())
+
+    def get_datastores(self):
+        return self.map(lambda x: x.get_datastores())
+
+    def get_services(self):
+        return self.map(lambda x: x.get_services())
+
+    def get_virtual_switches(self):
+        return self.map(lambda x: x.get_virtual_switches())
+
+
+class VirtualMachine(object):
+    def __init__(self, esx_client, raw_virtual_machine, properties=None):
+
+        self._client = esx_client
+        self._raw_virtual_machine = raw_virtual_machine
+        self._tools_credentials = None
+        self._properties = dict(properties or {})
+        self.name = self._read_property('name')
+        self.uuid = self._read_property('summary.config.uuid')
+
+    def _read_property(self, path):
+        # Prefer the live mirror, then the bulk-retrieved value, fallback to lazy pyVmomi attribute access
+        inventory_mirror = self._client._get_ready_inventory_mirror()
+        if inventory_mirror:
+            properties = inventory_mirror.get_properties(self._raw_virtual_machine)
+            if properties and path in properties:
+                return properties[path]
+
+        if path in self._properties:
+            return self._properties[path]
+
+        value = self._raw_virtual_machine
+        for attribute in path.split('.'):
+            if value is None:
+                break
+            value = getattr(value, attribute)
+
+        return value
+
+    def _invalidate_power_state(self):
+        self._properties.pop('runtime.powerState', None)
+
+    def _refresh_power_state(self):
+        # While the inventory mirror is ready it keeps the power state up to date, and _read_property prefers it anyway
+        if not self._client._get_ready_inventory_mirror():
+            self.refresh(['runtime.powerState'])
+
+    def get_snapshots(self):
+        for snapshot in self.get_snapshot_tree():
+            yield snapshot
+
+    def get_snapshot_tree(self):
+        """
+        Reads the whole snapshot hierarchy in a single call (or from the inventory mirror when it is running)
+        :return: SnapshotTree
+        """
+
+        inventory_mirror = self._client._get_ready_inventory_mirror()
+        if inventory_mirror:
+            snapshot_info = self._read_property('snapshot')
+        else:
+            self.refresh(['snapshot'])
+            snapshot_info = self._properties['snapshot']
+
+        return SnapshotTree(self._client, snapshot_info)
+
+    def _iterate_network_interfaces(self):
+        for hardware_device in self._raw_virtual_machine.config.hardware.device:
+            if isinstance(hardware_device, vim.vm.device.VirtualEthernetCard):
+                yield hardware_device
+
+    def power_on(self, verify_state=True, wait=True):
+
+        if verify_state:
+            self._refresh_power_state()
+            if self.is_powered_on():
+                return None if wait else TaskFuture.completed()
+
+        task = self._raw_virtual_machine.PowerOnVM_Task()
+        self._invalidate_power_state()
+        return self._client._run_task(task, wait)
+
+    def rename(self, new_name, wait=True):
+        task = self._raw_virtual_machine.Rename_Task(new_name)
+
+        def on_success(result):
+            if self._client._virtual_machine_index is not None:
+                self._client._virtual_machine_index.pop(self.name, None)
+                self._client._virtual_machine_index[new_name] = self._raw_virtual_machine
+
+            self.name = new_name
+
+        return self._client._run_task(task, wait, on_success=on_success)
+
+    def shutdown(self, verify_state=True):
+
+        if verify_state:
+            self._refresh_power_state()
+            if self.is_powered_off():
+                return
+
+        self._raw_virtual_machine.ShutdownGuest()
+        self._invalidate_power_state()
+
+    def power_off(self, verify_state=True, wait=True):
+
+        if verify_state:
+            self._refresh_power_state()
+            if self.is_powered_off():
+                return None if wait else TaskFuture.completed()
+
+        task = self._raw_virtual_machine.PowerOffVM_Task()
+        self._invalidate_power_state()
+        return self._client._run_task(task, wait)
+
+    def reboot(self, wait=True):
+        task = self._raw_virtual_machine.ResetVM_Task()
+        self._invalidate_power_state()
+        return self._client._run_task(task, wait)
+
+    def remove_all_snapshots(self, consolidate=False, wait=True):
+        task = self._raw_virtual_machine.RemoveAllSnapshots_Task(consolidate)
+        return self._client._run_task(task, wait)
+
+    def delete(self, wait=True):
+        task = self._raw_virtual_machine.Destroy_Task()
+
+        def on_success(result):
+            if self._client._virtual_machine_index is not None:
+                self._client._virtual_machine_index.pop(self.name, None)
+
+        return self._client._run_task(task, wait, on_success=on_success)
+
+    def take_snapshot(self, name, description="", memory=False, try_persist_disk=True, wait=True):
+        task = self._raw_virtual_machine.CreateSnapshot(name, description, memory, try_persist_disk)
+        return self._client._run_task(task, wait)
+
+    def clone(self, name, snapshot_name=None, linked=False, cpus=None, ram_mb=None, network_name=None, datastore_name=None, power_on=False, wait=True):
+        """
+        Clones this virtual machine. requires vCenter, a standalone ESXi host does not support CloneVM_Task
+        :param snapshot_name: clone the state of this snapshot instead of the current state. required for a linked clone
+        :param linked: create a linked clone, whose disks are delta disks on top of the snapshot's disks instead of full copies
+        :param network_name: connect all network interfaces of the clone to this network
+        :param datastore_name: datastore of the clone. defaults to the datastore of this virtual machine
+        :return: the new VirtualMachine. when wait=False, a TaskFuture of the new vim.VirtualMachine reference
+        """
+
+        folder, snapshot = self._get_clone_source(snapshot_name, linked)
+        network_interfaces = list(self._iterate_network_interfaces()) if network_name else []
+        spec = self._new_clone_spec(snapshot, linked, network_interfaces, cpus=cpus, ram_mb=ram_mb, network_name=network_name, datastore_name=datastore_name, power_on=power_on)
+
+        task = self._raw_virtual_machine.CloneVM_Task(folder=folder, name=name, spec=spec)
+
+        def on_success(result):
+            if self._client._virtual_machine_index is not None:
+                self._client._virtual_machine_index[name] = result
+
+        result = self._client._run_task(task, wait, on_success=on_success)
+        if not wait:
+            return result
+
+        return self._client._load_virtual_machine(result)
+
+    def clone_many(self, clones, snapshot_name=None, linked=False, power_on=False, max_workers=8):
+        """
+        Clones this virtual machine into many new ones at once. requires vCenter
+        :param clones: names of the clones, or dicts for clones that need customization, e.g. {'name': 'vm-1', 'cpus': 4, 'network_name': 'Lab'}.
+                       supported keys are name, cpus, ram_mb, network_name, datastore_name and power_on
+        :param snapshot_name: clone the state of this snapshot instead of the current state, for all of the clones. required for linked clones
+        :param linked: create linked clones
+        :param power_on: default power_on of the clones
+        :param max_workers: maximum number of CloneVM_Task calls submitted at the same time
+        :return: list of TaskResult in the order of clones. the target of each is the name, the result is the new VirtualMachine
+        """
+
+        clones = [x if isinstance(x, dict) else {'name': x} for x in clones]
+        results = [None] * len(clones)
+
+        # The source, its network interfaces and the shared references are resolved once
+        folder, snapshot = self._get_clone_source(snapshot_name, linked)
+        network_interfaces = list(self._iterate_network_interfaces()) if any(x.get('network_name') for x in clones) else []
+
+        specs = {}
+        for i, clone in enumerate(clones):
+            clone = dict(clone)
+            clone.setdefault('power_on', power_on)
+            name = clone.pop('name', None)
+            try:
+                # All of the clones share the source and the way of cloning, and clone_many always waits for them
+                shared = [key for key in ('snapshot_name', 'linked', 'wait') if key in clone]
+                if shared:
+                    raise Exception('clone "{0}" sets {1}, which cannot be set per clone'.format(name, ', '.join(shared)))
+
+                specs[i] = (name, self._new_clone_spec(snapshot, linked, network_interfaces, **clone))
+            except Exception as e:
+                results[i] = TaskResult(None, error=e, target=name)
+
+        task_results = self._client._run_tasks(sorted(specs), lambda i: self._raw_virtual_machine.CloneVM_Task(folder=folder, name=specs[i][0], spec=specs[i][1]), max_workers=max_workers)
+        self._client._collect_created_virtual_machines(task_results, {i: specs[i][0] for i in specs}, results)
+        return results
+
+    def _get_clone_source(self, snapshot_name, linked):
+        snapshot = None
+        if snapshot_name:
+            snapshot = self.get_snapshot(snapshot_name)
+            if not snapshot:
+                raise Exception('virtual machine "{0}" does not have a snapshot named "{1}"'.format(self.name, snapshot_name))
+
+        elif linked:
+            raise Exception('a linked clone requires a snapshot to clone from')
+
+        # Clones are placed next to their source. virtual machines of a vApp have no parent folder
+        folder = self._raw_virtual_machine.parent
+        if not isinstance(folder, vim.Folder):
+            folder, _ = self._client._get_default_placement()
+
+        return folder, snapshot
+
+    def _new_clone_spec(self, snapshot, linked, network_interfaces, cpus=None, ram_mb=None, network_name=None, datastore_name=None, power_on=False):
+        relocate_spec = vim.vm.RelocateSpec()
+        if linked:
+            # Delta disks on top of the snapshot's disks, instead of copying them
+            relocate_spec.diskMoveType = 'createNewChildDiskBacking'
+
+        if datastore_name:
+            relocate_spec.datastore = self._client.get_managed_object(vim.Datastore, datastore_name)
+            if relocate_spec.datastore is None:
+                raise Exception('datastore "{0}" does not exist'.format(datastore_name))
+
+        config = vim.vm.ConfigSpec()
+        config.deviceChange = []
+
+        if cpus is not None:
+            config.numCPUs = cpus
+
+        if ram_mb is not None:
+            config.memoryMB = ram_mb
+
+        if network_name:
+            network = self._client.get_managed_object(vim.Network, network_name)
+            if network is None:
+                raise Exception('network "{0}" does not exist'.format(network_name))
+
+            for network_interface in network_interfaces:
+                # The source's devices are shared by all clones of a batch, each spec edits its own copy
+                network_interface = copy.deepcopy(network_interface)
+                network_interface.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(deviceName=network_name, network=network)
+
+                network_spec = vim.vm.device.VirtualDeviceSpec()
+                network_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+                network_spec.device = network_interface
+                config.deviceChange.append(network_spec)
+
+        spec = vim.vm.CloneSpec(location=relocate_spec, config=config, powerOn=power_on, template=False)
+        if snapshot:
+            spec.snapshot = snapshot._raw_snapshot.snapshot
+
+        return spec
+
+    def reconfigure(self, wait=True):
+        """
+        Collects changes of this virtual machine and applies them all at once, in a single ReconfigVM_Task. e.g.
+
+            with vm.reconfigure() as changes:
+                changes.set_cpus(4).set_memory(8192)
+                changes.add_disk(50)
+
+        :return: VirtualMachineReconfiguration, applied when the with block ends or by calling commit()
+        """
+
+        return VirtualMachineReconfiguration(self, wait=wait)
+
+    def configure_bios(self, enter_bios=None, boot_delay=None, boot_order=None, wait=True):
+        return self.reconfigure(wait=wait).configure_bios(enter_bios=enter_bios, boot_delay=boot_delay, boot_order=boot_order).commit()
+
+    def refresh(self, properties=None):
+        """
+        Re-reads this virtual machine's properties from the server in a single call
+        :param properties: property paths to re-read, e.g. ['runtime.powerState']. defaults to VIRTUAL_MACHINE_PROPERTIES
+        """
+
+        path_set = properties or VIRTUAL_MACHINE_PROPERTIES
+
+        try:
+            items = self._client._retrieve_properties(vim.VirtualMachine, path_set, objects=[self._raw_virtual_machine])
+        except vmodl.fault.ManagedObjectNotFound:
+            raise Exception('Virtual Machine "{}" is missing'.format(self.name))
+
+        for _, values in items:
+            self._properties.update(values)
+
+        if 'name' in path_set:
+            self.name = self._properties['name']
+
+        if 'summary.config.uuid' in path_set:
+            self.uuid = self._properties['summary.config.uuid']
+
+    def is_powered_on(self):
+        return self._read_property('runtime.powerState') == 'poweredOn'
+
+    def is_powered_off(self):
+        return self._read_property('runtime.powerState') == 'poweredOff'
+
+    def is_suspended(self):
+        return self._read_property('runtime.powerState') == 'suspended'
+
+    def remove_all_network_interfaces(self, wait=True):
+        return self.reconfigure(wait=wait).remove_all_network_interfaces().commit()
+
+    def add_network_interface(self, network_name, adapter_type='vmxnet3', wait=True):
+        return self.reconfigure(wait=wait).add_network_interface(network_name, adapter_type).commit()
+
+    def get_network_interfaces(self):
+
+        for network_interface in self._iterate_network_interfaces():
+            yield {
+                "mac_address": network_interface.macAddress,
+                "label": network_interface.deviceInfo.label,
+                "network": network_interface.deviceInfo.summary
+            }
+
+    def get_snapshot(self, name):
+        return self.get_snapshot_tree().get_by_name(name)
+
+    def get_tools_status(self):
+        inventory_mirror = self._client._get_ready_inventory_mirror()
+        if inventory_mirror:
+            return self._read_property('guest.toolsStatus')
+
+        return self._raw_virtual_machine.guest.toolsStatus
+
+    def is_tools_working_properly(self):
+        tools_status = self.get_tools_status()
+        return (tools_status != "toolsNotInstalled" and
+                tools_status != "toolsNotRunning")
+
+    def vmware_tools_login(self, username, password):
+        self._tools_credentials = vim.vm.guest.NamePasswordAuthentication(username=username,
+                                                                          password=password)
+
+    def vmware_tools_execute_process(self, program_path, working_directory, arguments="", environment_variables=None):
+        self._ensure_vmware_tools_logged_in()
+
+        spec = vim.vm.guest.ProcessManager.ProgramSpec(programPath=program_path,
+                                                       arguments=arguments,
+                                                       workingDirectory=working_directory,
+                                                       envVariables=environment_variables)
+
+        pid = self._client.get_guest_operations_manager().processManager.StartProgramInGuest(vm=self._raw_virtual_machine,
+                                                                                             auth=self._tools_credentials,
+                                                                                             spec=spec)
+        return pid
+
+    def _wait_for_guest_process(self, pid, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        backoff = _Backoff()
+
+        while True:
+            processes = self.vmware_tools_list_processes(pids=[pid])
+            process = next((x for x in processes if x.pid == pid), None)
+            if process is None:
+                raise Exception('guest process {0} is missing'.format(pid))
+
+            if process.endTime is not None:
+                return process
+
+            if deadline is not None and time.time() >= deadline:
+                self._client.get_guest_operations_manager().processManager.TerminateProcessInGuest(vm=self._raw_virtual_machine,
+                                                                                                   auth=self._tools_credentials,
+                                                                                                   pid=pid)
+                raise Exception('guest process {0} did not finish within {1} seconds and was terminated'.format(pid, timeout))
+
+            backoff.sleep()
+
+    def vmware_tools_run(self, program_path, arguments="", working_directory=None, environment_variables=None, capture_output=False, timeout=None):
+        """
+        Runs a program in the guest and waits for it to finish. completion is polled with an adaptive backoff, so short commands return in milliseconds
+        :param capture_output: redirect stdout and stderr to guest temporary files and download them
+        :param timeout: seconds to wait before terminating the process. waits forever by default
+        :return: GuestProcessResult
+        """
+
+        self._ensure_vmware_tools_logged_in()
+
+        is_windows = self._read_property('guest.guestFamily') == 'windowsGuest'
+        if working_directory is None:
+            working_directory = 'C:\\' if is_windows else '/'
+
+        output_paths = None
+        if capture_output:
+            output_paths = [self._client.get_guest_operations_manager().fileManager.CreateTemporaryFileInGuest(vm=self._raw_virtual_machine,
+                                                                                                               auth=self._tools_credentials,
+                                                                                                               prefix='vmwc-',
+                                                                                                               suffix=suffix)
+                            for suffix in ('.stdout', '.stderr')]
+
+            program_path, arguments = self._redirect_guest_output(program_path, arguments, output_paths[0], output_paths[1], is_windows)
+
+        try:
+            pid = self.vmware_tools_execute_process(program_path, working_directory, arguments=arguments, environment_variables=environment_variables)
+            process = self._wait_for_guest_process(pid, timeout=timeout)
+
+            result = GuestProcessResult(pid, process.exitCode, process.startTime, process.endTime)
+            if output_paths:
+                result.stdout, result.stderr = [self._read_guest_file(x) for x in output_paths]
+
+            return result
+
+        finally:
+            for output_path in output_paths or []:
+                try:
+                    self.vmware_tools_delete_file(output_path)
+                except vmodl.MethodFault as e:
+                    logging.warning('failed to delete guest file "{0}". {1}'.format(output_path, e))
+
+    @staticmethod
+    def _redirect_guest_output(program_path, arguments, stdout_path, stderr_path, is_windows):
+        command = '"{0}" {1} > "{2}" 2> "{3}"'.format(program_path, arguments, stdout_path, stderr_path)
+
+        if is_windows:
+            return 'C:\\Windows\\System32\\cmd.exe', '/c "{0}"'.format(command)
+
+        return '/bin/sh', "-c '{0}'".format(command.replace("'", "'\\''"))
+
+    def _read_guest_file(self, remote_file_path):
+        local_file = tempfile.NamedTemporaryFile(delete=False)
+        local_file.close()
+
+        try:
+            self.vmware_tools_download_file(local_file.name, remote_file_path)
+            with open(local_file.name, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(local_file.name)
+
+    def _ensure_vmware_tools_logged_in(self):
+        if self._tools_credentials is None:
+            raise Exception("VMWare tools login is required in order to use this functionality")
+
+    def vmware_tools_upload_file(self, local_file_path, remote_file_path):
+        self._ensure_vmware_tools_logged_in()
+
+        with open(local_file_path, "rb") as fin:
+            size = os.fstat(fin.fileno()).st_size
+            self.vmware_tools_upload_stream(fin, remote_file_path, size)
+
+    def vmware_tools_upload_stream(self, stream, remote_file_path, size):
+        """
+        Uploads to the guest without holding the content in memory
+        :param stream: readable file-like object (e.g. a pipe) or an iterator of bytes chunks (e.g. a generated tarball)
+        :param size: exact number of bytes the stream provides
+        """
+
+        self._ensure_vmware_tools_logged_in()
+
+        file_attributes = vim.vm.guest.FileManager.FileAttributes()
+        url = self._client.get_guest_operations_manager().fileManager.InitiateFileTransferToGuest(vm=self._raw_virtual_machine,
+                                                                                                  auth=self._tools_credentials,
+                                                                                                  guestFilePath=remote_file_path,
+                                                                                                  fileAttributes=file_attributes,
+                                                                                                  fileSize=size,
+                                                                                                  overwrite=True)
+
+        url = self._normalize_url(url)
+
+        # requests treats an empty body of unknown type as chunked, an empty file has to be sent as b'' to get "Content-Length: 0"
+        data = _SizedStream(stream, size) if size else b''
+        r = self._client.http_session.put(url, data=data)
+        r.raise_for_status()
+
+    def _normalize_url(self, url):
+        return url.replace("https://*", "https://" + self._client.host)
+
+    def vmware_tools_download_file(self, local_file_path, remote_file_path, chunk_size=1024 * 1024, progress_callback=None, resume=False, segments=1):
+        """
+        :param chunk_size: size of the reusable buffer the response is read into
+        :param progress_callback: called as progress_callback(downloaded_bytes, total_bytes)
+        :param resume: continue an existing partial local file with an HTTP Range request
+        :param segments: number of parallel ranged connections to download with
+        :return: size of the downloaded file
+
+        resume and segments require the guest transfer URL to honour HTTP Range, otherwise the file is downloaded from the start in a single stream
+        """
+
+        self._ensure_vmware_tools_logged_in()
+
+        fti = self._initiate_file_transfer_from_guest(remote_file_path)
+        total_size = fti.size
+        progress = _DownloadProgress(total_size, progress_callback)
+
+        offset = 0
+        if resume and os.path.exists(local_file_path):
+            offset = os.path.getsize(local_file_path)
+            if offset > total_size:
+                offset = 0
+
+        if offset == total_size and total_size:
+            progress.add(total_size)
+            return total_size
+
+        if segments > 1 and offset == 0 and total_size >= segments * chunk_size:
+            try:
+                return self._download_segments(local_file_path, remote_file_path, fti, segments, chunk_size, progress)
+            except _RangeNotSupported:
+                logging.info('guest file transfer does not honour HTTP Range, downloading "{0}" in a single stream'.format(remote_file_path))
+                progress.reset()
+                fti = self._initiate_file_transfer_from_guest(remote_file_path)
+
+        with open(local_file_path, 'r+b' if offset else 'wb') as f:
+            try:
+                self._download_range(fti.url, f, offset, total_size, chunk_size, progress)
+            except _RangeNotSupported:
+                # Resume is not possible, start over
+                f.seek(0)
+                f.truncate()
+                fti = self._initiate_file_transfer_from_guest(remote_file_path)
+                self._download_range(fti.url, f, 0, total_size, chunk_size, progress)
+
+            return f.tell()
+
+    def _initiate_file_transfer_from_guest(self, remote_file_path):
+        return self._client.get_guest_operations_manager().fileManager.InitiateFileTransferFromGuest(vm=self._raw_virtual_machine,
+                                                                                                     auth=self._tools_credentials,
+                                                                                                     guestFilePath=remote_file_path)
+
+    def _download_range(self, url, f, start, end, chunk_size, progress):
+        headers = {}
+        if start:
+            headers['Range'] = 'bytes={0}-{1}'.format(start, end - 1)
+
+        url = self._normalize_url(url)
+        r = self._client.http_session.get(url, headers=headers, stream=True)
+        try:
+            r.raise_for_status()
+
+            if start and r.status_code != 206:
+                raise _RangeNotSupported()
+
+            f.seek(start)
+            progress.add(start)
+            written_size = self._write_response(r, f, end - start, chunk_size, progress)
+
+            # The partial file is kept, a following download with resume=True continues it
+            if written_size != end - start:
+                raise Exception('guest file transfer ended {0} bytes early, download again with resume=True to continue'.format(end - start - written_size))
+
+        finally:
+            r.close()
+
+    @staticmethod
+    def _write_response(r, f, size, chunk_size, progress):
+        # Read straight into a single reusable buffer, without intermediate chunk objects
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        remaining = size
+
+        while remaining > 0:
+            read_size = r.raw.readinto(view[:min(chunk_size, remaining)])
+            if not read_size:
+                break
+
+            f.write(view[:read_size])
+            remaining -= read_size
+            progress.add(read_size)
+
+        return size - remaining
+
+    def _download_segments(self, local_file_path, remote_file_path, fti, segments, chunk_size, progress):
+        total_size = fti.size
+        segment_size = int(math.ceil(total_size / float(segments)))
+        ranges = [(start, min(start + segment_size, total_size)) for start in range(0, total_size, segment_size)]
+
+        # The file is sized up front and its segments are written out of order, so it is complete only once all of them are.
+        # Until then it is kept under a temporary name, which a following download with resume=True does not mistake for a complete file
+        partial_file_path = local_file_path + '.part'
+        with open(partial_file_path, 'wb') as f:
+            f.truncate(total_size)
+
+        def download_segment(segment_range):
+            start, end = segment_range
+
+            # Every segment uses a transfer URL of its own
+            url = fti.url if start == 0 else self._initiate_file_transfer_from_guest(remote_file_path).url
+
+            headers = {'Range': 'bytes={0}-{1}'.format(start, end - 1)}
+            r = self._client.http_session.get(self._normalize_url(url), headers=headers, stream=True)
+            try:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise _RangeNotSupported()
+
+                with open(partial_file_path, 'r+b') as segment_file:
+                    segment_file.seek(start)
+                    written_size = self._write_response(r, segment_file, end - start, chunk_size, progress)
+
+                if written_size != end - start:
+                    raise Exception('guest file transfer of "{0}" ended {1} bytes early'.format(remote_file_path, end - start - written_size))
+            finally:
+                r.close()
+
+        try:
+            self._client._map_concurrently(download_segment, ranges, segments)
+        except:
+            os.remove(partial_file_path)
+            raise
+
+        if os.path.exists(local_file_path):
+            os.remove(local_file_path)
+
+        os.rename(partial_file_path, local_file_path)
+        return total_size
+
+    def vmware_tools_create_temporary_directory(self, prefix, suffix=""):
+        self._ensure_vmware_tools_logged_in()
+
+        temporary_directory = self._client.get_guest_operations_manager().fileManager.CreateTemporaryDirectoryInGuest(vm=self._raw_virtual_machine,
+                                                                                                                      auth=self._tools_credentials,
+                                                                                                                      prefix=prefix,
+                                                                                                                      suffix=suffix)
+        return temporary_directory
+
+    def vmware_tools_create_directory(self, remote_directory_path, create_parents=True):
+        self._ensure_vmware_tools_logged_in()
+
+        try:
+            self._client.get_guest_operations_manager().fileManager.MakeDirectoryInGuest(vm=self._raw_virtual_machine,
+                                                                                          auth=self._tools_credentials,
+                                                                                          directoryPath=remote_directory_path,
+                                                                                          createParentDirectories=create_parents)
+        except vim.fault.FileAlreadyExists:
+            pass
+
+    def vmware_tools_delete_file(self, remote_file_path):
+        self._ensure_vmware_tools_logged_in()
+
+        self._client.get_guest_operations_manager().fileManager.DeleteFileInGuest(vm=self._raw_virtual_machine,
+                                                                                  auth=self._tools_credentials,
+                                                                                  filePath=remote_file_path)
+
+    def vmware_tools_list_files(self, remote_directory_path):
+        self._ensure_vmware_tools_logged_in()
+
+        index = 0
+        while True:
+            response = self._client.get_guest_operations_manager().fileManager.ListFilesInGuest(vm=self._raw_virtual_machine,
+                                                                                                auth=self._tools_credentials,
+                                                                                                filePath=remote_directory_path,
+                                                                                                index=index)
+            for file_info in response.files or []:
+                if file_info.path in ('.', '..'):
+                    continue
+
+                yield file_info
+
+            index += len(response.files or [])
+            if not response.remaining:
+                break
+
+    def vmware_tools_upload_tree(self, local_directory_path, remote_directory_path, max_workers=4, pack=False):
+        """
+        Uploads a local directory recursively
+        :param max_workers: maximum number of concurrent file transfers
+        :param pack: ship the whole tree as a single tar.gz archive and extract it in the guest with /bin/tar (posix guests only).
+                     much faster for many small files, as it avoids a file transfer round trip per file
+        """
+
+        self._ensure_vmware_tools_logged_in()
+
+        if pack:
+            return self._upload_tree_packed(local_directory_path, remote_directory_path)
+
+        files = []
+        for directory_path, _, file_names in os.walk(local_directory_path):
+            relative_parts = self._split_relative_path(local_directory_path, directory_path)
+            remote_path = self._join_guest_path(remote_directory_path, *relative_parts)
+
+            # Parents are walked before their children
+            self.vmware_tools_create_directory(remote_path)
+
+            for file_name in file_names:
+                files.append((os.path.join(directory_path, file_name), self._join_guest_path(remote_path, file_name)))
+
+        self._client._map_concurrently(lambda x: self.vmware_tools_upload_file(*x), files, max_workers)
+
+    def vmware_tools_download_tree(self, remote_directory_path, local_directory_path, max_workers=4, pack=False):
+        """
+        Downloads a guest directory recursively
+        :param max_workers: maximum number of concurrent file transfers
+        :param pack: archive the tree in the guest with /bin/tar and ship it as a single tar.gz file (posix guests only)
+        """
+
+        self._ensure_vmware_tools_logged_in()
+
+        if pack:
+            return self._download_tree_packed(remote_directory_path, local_directory_path)
+
+        files = []
+        directories = [(remote_directory_path, local_directory_path)]
+
+        while directories:
+            remote_path, local_path = directories.pop()
+
+            if not os.path.isdir(local_path):
+                os.makedirs(local_path)
+
+            for file_info in self.vmware_tools_list_files(remote_path):
+                remote_child_path = self._join_guest_path(remote_path, file_info.path)
+                local_child_path = os.path.join(local_path, file_info.path)
+
+                if file_info.type == 'directory':
+                    directories.append((remote_child_path, local_child_path))
+                elif file_info.type == 'file':
+                    files.append((local_child_path, remote_child_path))
+
+        self._client._map_concurrently(lambda x: self.vmware_tools_download_file(*x), files, max_workers)
+
+    def _upload_tree_packed(self, local_directory_path, remote_directory_path):
+        local_archive = tempfile.NamedTemporaryFile(suffix='.tar.gz', delete=False)
+        try:
+            with tarfile.open(fileobj=local_archive, mode='w:gz') as archive:
+                archive.add(local_directory_path, arcname='.')
+            local_archive.close()
+
+            remote_archive_path = self._client.get_guest_operations_manager().fileManager.CreateTemporaryFileInGuest(vm=self._raw_virtual_machine,
+                                                                                                                     auth=self._tools_credentials,
+                                                                                                                     prefix='vmwc-',
+                                                                                                                     suffix='.tar.gz')
+            try:
+                self.vmware_tools_upload_file(local_archive.name, remote_archive_path)
+                self.vmware_tools_create_directory(remote_directory_path)
+                self._run_guest_tar('-xzf "{0}" -C "{1}"'.format(remote_archive_path, remote_directory_path))
+            finally:
+                self.vmware_tools_delete_file(remote_archive_path)
+        finally:
+            local_archive.close()
+            os.remove(local_archive.name)
+
+    def _download_tree_packed(self, remote_directory_path, local_directory_path):
+        remote_archive_path = self._client.get_guest_operations_manager().fileManager.CreateTemporaryFileInGuest(vm=self._raw_virtual_machine,
+                                                                                                                 auth=self._tools_credentials,
+                                                                                                                 prefix='vmwc-',
+                                                                                                                 suffix='.tar.gz')
+        local_archive = tempfile.NamedTemporaryFile(suffix='.tar.gz', delete=False)
+        local_archive.close()
+
+        try:
+            self._run_guest_tar('-czf "{0}" -C "{1}" .'.format(remote_archive_path, remote_directory_path))
+            self.vmware_tools_download_file(local_archive.name, remote_archive_path)
+
+            root_path = os.path.realpath(local_directory_path)
+
+            with tarfile.open(local_archive.name, mode='r:gz') as archive:
+                members = archive.getmembers()
+                for member in members:
+                    # Refuse archive entries escaping the destination directory
+                    destination = os.path.realpath(os.path.join(root_path, member.name))
+                    if destination != root_path and not destination.startswith(root_path + os.sep):
+                        raise Exception('unsafe path "{0}" in guest archive'.format(member.name))
+
+                if hasattr(tarfile, 'data_filter'):
+                    archive.extractall(root_path, members=members, filter='data')
+                else:
+                    archive.extractall(root_path, members=members)
+        finally:
+            os.remove(local_archive.name)
+            self.vmware_tools_delete_file(remote_archive_path)
+
+    def _run_guest_tar(self, arguments):
+        pid = self.vmware_tools_execute_process('/bin/tar', '/', arguments=arguments)
+        process = self._wait_for_guest_process(pid)
+        if process.exitCode != 0:
+            raise Exception('/bin/tar {0} failed in the guest with exit code {1}'.format(arguments, process.exitCode))
+
+    @staticmethod
+    def _split_relative_path(root_path, path):
+        relative_path = os.path.relpath(path, root_path)
+        if relative_path == os.curdir:
+            return []
+
+        return relative_path.split(os.sep)
+
+    @staticmethod
+    def _join_guest_path(directory_path, *parts):
+        # Follow the guest's own separator, windows guests use backslashes
+        separator = '\\' if '\\' in directory_path else '/'
+
+        path = directory_path
+        for part in parts:
+            path = path.rstrip(separator) + separator + part
+
+        return path
+
+    def vmware_tools_list_processes(self, pids=None, max_retries=5, retry_delay_seconds=5):
+        self._ensure_vmware_tools_logged_in()
+
+        attempt = 0
+        while True:
+            try:
+                response = self._client.get_guest_operations_manager().processManager.ListProcessesInGuest(vm=self._raw_virtual_machine,
+                                                                                                           auth=self._tools_credentials,
+                                                                                                           pids=pids)
+                return response
+            except:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                time.sleep(retry_delay_seconds)
+
+
+class VirtualMachineReconfiguration(object):
+    """
+    Changes of a virtual machine, collected into a single ConfigSpec and applied by a single ReconfigVM_Task.
+    The current devices are read once, the first time a change needs them
+    """
+
+    def __init__(self, virtual_machine, wait=True):
+        self._virtual_machine = virtual_machine
+        self._client = virtual_machine._client
+        self._wait = wait
+        self._spec = vim.vm.ConfigSpec()
+        self._spec.deviceChange = []
+        self._device_keys = _DeviceKeyAllocator()
+        self._devices = None
+        self._removed_device_keys = set()
+        self._edited_devices = {}
+        self._dirty = False
+        self._committed = False
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        # Nothing is applied when the block fails
+        if type is None and not self._committed:
+            self.commit()
+
+    def commit(self):
+        """
+        Applies all of the collected changes
+        :return: the task result, or a TaskFuture when wait=False
+        """
+
+        if self._committed:
+            raise Exception('this reconfiguration was already committed')
+
+        self._committed = True
+
+        if not self._dirty:
+            return None if self._wait else TaskFuture.completed()
+
+        task = self._virtual_machine._raw_virtual_machine.ReconfigVM_Task(spec=self._spec)
+        self.result = self._client._run_task(task, self._wait)
+        return self.result
+
+    def set_cpus(self, cpus, cores_per_socket=None):
+        self._spec.numCPUs = cpus
+        if cores_per_socket is not None:
+            self._spec.numCoresPerSocket = cores_per_socket
+
+        self._dirty = True
+        return self
+
+    def set_memory(self, ram_mb):
+        self._spec.memoryMB = ram_mb
+        self._dirty = True
+        return self
+
+    def configure_bios(self, enter_bios=None, boot_delay=None, boot_order=None):
+        if self._spec.bootOptions is None:
+            self._spec.bootOptions = vim.vm.BootOptions()
+
+        if boot_order is not None:
+            self._spec.bootOptions.bootOrder = []
+
+            for device in boot_order:
+
+                if device == 'network':
+                    first_network_interface = next(self._iterate_devices(vim.vm.device.VirtualEthernetCard, include_added=True), None)
+                    if not first_network_interface:
+                        raise Exception('There is no network interface to boot from. you need to configure at least 1 network interface first')
+
+                    boot_device = vim.vm.BootOptions.BootableEthernetDevice(deviceKey=first_network_interface.key)
+
+                elif device == 'disk':
+                    first_disk = next(self._iterate_devices(vim.vm.device.VirtualDisk, include_added=True), None)
+                    if not first_disk:
+                        raise Exception('There is no disks to boot from. you need to configure at least 1 disk first')
+
+                    boot_device = vim.vm.BootOptions.BootableDiskDevice(deviceKey=first_disk.key)
+
+                elif device == 'cdrom':
+                    boot_device = vim.vm.BootOptions.BootableCdromDevice()
+
+                else:
+                    raise Exception('device "{}" is not supported'.format(device))
+
+                self._spec.bootOptions.bootOrder.append(boot_device)
+
+        if boot_delay is not None:
+            self._spec.bootOptions.bootDelay = boot_delay
+
+        if enter_bios is not None:
+            self._spec.bootOptions.enterBIOSSetup = enter_bios
+
+        self._dirty = True
+        return self
+
+    def add_network_interface(self, network_name, adapter_type='vmxnet3', mac_address=None):
+        network_spec = self._client._add_new_network_interface(self._device_keys, network_name, adapter_type, mac_address=mac_address)
+        self._spec.deviceChange.append(network_spec)
+        self._dirty = True
+        return self
+
+    def edit_network_interface(self, network_interface, network_name=None, connected=None, connect_on_power_on=None):
+        """
+        :param network_interface: mac address or label (e.g. 'Network adapter 1') of an existing network interface
+        """
+
+        device = self._edit_device(self._find_device(vim.vm.device.VirtualEthernetCard, network_interface))
+
+        if network_name is not None:
+            device.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo()
+            device.backing.deviceName = network_name
+            device.backing.network = self._client.get_managed_object(vim.Network, network_name)
+            if device.backing.network is None:
+                raise Exception('network "{0}" does not exist'.format(network_name))
+
+        if connected is not None or connect_on_power_on is not None:
+            if device.connectable is None:
+                device.connectable = vim.vm.device.VirtualDevice.ConnectInfo()
+
+            if connected is not None:
+                device.connectable.connected = connected
+
+            if connect_on_power_on is not None:
+                device.connectable.startConnected = connect_on_power_on
+
+        return self
+
+    def remove_network_interface(self, network_interface):
+        """
+        :param network_interface: mac address or label (e.g. 'Network adapter 1') of an existing network interface
+        """
+
+        self._remove_device(self._find_device(vim.vm.device.VirtualEthernetCard, network_interface))
+        return self
+
+    def remove_all_network_interfaces(self):
+        for network_interface in list(self._iterate_devices(vim.vm.device.VirtualEthernetCard)):
+            self._remove_device(network_interface)
+
+        return self
+
+    def add_disk(self, size_gb, thin_provision=True, label=None):
+        """
+        Adds a new disk on the first SCSI controller, in the directory of the virtual machine
+        """
+
+        controller = next(self._iterate_devices(vim.vm.device.VirtualSCSIController), None)
+        if not controller:
+            raise Exception('There is no SCSI controller to attach the disk to')
+
+        disks = list(self._iterate_devices(vim.vm.device.VirtualDisk, include_added=True))
+
+        # Unit 7 is taken by the controller itself
+        used_unit_numbers = set(x.unitNumber for x in disks if x.controllerKey == controller.key)
+        used_unit_numbers.add(7)
+        unit_number = next((x for x in range(16) if x not in used_unit_numbers), None)
+        if unit_number is None:
+            raise Exception('There is no free unit left on controller "{0}"'.format(controller.deviceInfo.label))
+
+        label = label or 'DISK-{0:03}'.format(len(disks) + 1)
+        disk_spec = self._client._add_new_hard_disk(self._device_keys, label, size_gb, unit_number, controller_key=controller.key, thin_provision=thin_provision)
+        self._spec.deviceChange.append(disk_spec)
+        self._dirty = True
+        return self
+
+    def extend_disk(self, disk, size_gb):
+        """
+        :param disk: label (e.g. 'Hard disk 1') or file name of an existing disk
+        """
+
+        device = self._edit_device(self._find_device(vim.vm.device.VirtualDisk, disk))
+
+        size_kb = int(size_gb * 1024.0 * 1024.0)
+        if size_kb < device.capacityInKB:
+            raise Exception('disk "{0}" cannot shrink'.format(device.deviceInfo.label))
+
+        device.capacityInKB = size_kb
+        if device.capacityInBytes is not None:
+            device.capacityInBytes = size_kb * 1024
+
+        return self
+
+    def _get_devices(self):
+        if self._devices is None:
+            raw_virtual_machine = self._virtual_machine._raw_virtual_machine
+            items = self._client._retrieve_properties(vim.VirtualMachine, ['config.hardware.device'], objects=[raw_virtual_machine])
+            self._devices = next((properties['config.hardware.device'] or [] for _, properties in items), [])
+
+        return self._devices
+
+    def _iterate_devices(self, device_type, include_added=False):
+        # Existing devices that are not removed by this reconfiguration, then optionally the ones it adds (with temporary keys)
+        for device in self._get_devices():
+            if isinstance(device, device_type) and device.key not in self._removed_device_keys:
+                yield device
+
+        if include_added:
+            for device_spec in self._spec.deviceChange:
+                if device_spec.operation == vim.vm.device.VirtualDeviceSpec.Operation.add and isinstance(device_spec.device, device_type):
+                    yield device_spec.device
+
+    def _find_device(self, device_type, identifier):
+        for device in self._iterate_devices(device_type):
+            backing_file_name = getattr(device.backing, 'fileName', None)
+            if identifier in (device.deviceInfo.label, getattr(device, 'macAddress', None), backing_file_name):
+                return device
+
+        raise Exception('virtual machine "{0}" does not have a device "{1}"'.format(self._virtual_machine.name, identifier))
+
+    def _edit_device(self, device):
+        # Several changes of the same device are merged into a single edit of a copy of it
+        device_spec = self._edited_devices.get(device.key)
+        if device_spec is None:
+            device_spec = vim.vm.device.VirtualDeviceSpec()
+            device_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+            device_spec.device = copy.deepcopy(device)
+
+            self._edited_devices[device.key] = device_spec
+            self._spec.deviceChange.append(device_spec)
+
+        self._dirty = True
+        return device_spec.device
+
+    def _remove_device(self, device):
+        edited_device_spec = self._edited_devices.pop(device.key, None)
+        if edited_device_spec is not None:
+            self._spec.deviceChange.remove(edited_device_spec)
+
+        device_spec = vim.vm.device.VirtualDeviceSpec()
+        device_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.remove
+        device_spec.device = device
+
+        self._removed_device_keys.add(device.key)
+        self._spec.deviceChange.append(device_spec)
+        self._dirty = True
+
+
+class InventoryMirror(object):
+    """
+    Local in-memory model of the inventory.
+    A single ContainerView based filter is subscribed once, then WaitForUpdatesEx version deltas are applied in a background thread,
+    so staleness is bounded by the update stream.
+    """
+
+    max_wait_seconds = 5
+    retry_delay_seconds = 5
+
+    def __init__(self, client, properties=None):
+        self._client = client
+        self._properties = properties or INVENTORY_MIRROR_PROPERTIES
+        self._mirrored_types = {}
+        self._lock = threading.Lock()
+        self._objects = dict((obj_type, {}) for obj_type in self._properties)
+        self._ready = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._property_collector = None
+        self._view = None
+
+    def start(self):
+        content = self._client._content
+
+        try:
+            self._view = content.viewManager.CreateContainerView(content.rootFolder, list(self._properties), True)
+            self._property_collector = content.propertyCollector.CreatePropertyCollector()
+
+            traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseEntities', path='view', skip=False, type=vim.view.ContainerView)
+
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+            filter_spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=self._view, skip=True, selectSet=[traversal_spec])]
+            filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=list(path_set), all=False) for obj_type, path_set in self._properties.items()]
+            self._property_collector.CreateFilter(filter_spec, True)
+        except:
+            # Do not leave the server side objects that were already created
+            self._destroy()
+            raise
+
+        self._thread = threading.Thread(target=self._run, name='vmwc-inventory-mirror')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+
+        if self._property_collector:
+            try:
+                self._property_collector.CancelWaitForUpdates()
+            except Exception:
+                pass
+
+        if self._thread:
+            self._thread.join(self.max_wait_seconds)
+
+        self._destroy()
+
+    def _destroy(self):
+        if self._property_collector:
+            try:
+                self._property_collector.DestroyPropertyCollector()
+            except Exception:
+                pass
+            self._property_collector = None
+
+        if self._view:
+            try:
+                self._view.Destroy()
+            except Exception:
+                pass
+            self._view = None
 
-        key = random.randint(-1050, -1000)
+    def is_ready(self):
+        return self._ready.is_set()
 
-        scsi_spec = vim.vm.device.VirtualDeviceSpec()
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
 
-        if adapter_type == "lsilogic":
-            summary = "LSI Logic"
-            scsi_spec.device = vim.vm.device.VirtualLsiLogicController()
-        elif adapter_type == "lsilogic_sas":
-            summary = "LSI Logic Sas"
-            scsi_spec.device = vim.vm.device.VirtualLsiLogicSASController()
-        elif adapter_type == "paravirtual":
-            summary = "VMware paravirtual SCSI"
-            scsi_spec.device = vim.vm.device.ParaVirtualSCSIController()
-        else:
-            # If type not specified or does not match, show error and return
-            if not adapter_type:
-                err_msg = "The type of '{0}' has not been specified".format(scsi_controller_label)
-            else:
-                err_msg = "Cannot create '{0}'. Invalid/unsupported type '{1}'".format(scsi_controller_label, adapter_type)
-            raise Exception(err_msg)
+    def get_objects(self, obj_type):
+        """
+        :return: list of (managed object, {property path: value}) tuples of the given type
+        """
 
-        scsi_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+        with self._lock:
+            return [(obj, dict(properties)) for obj, properties in self._objects[obj_type].values()]
 
-        scsi_spec.device.key = key
-        scsi_spec.device.busNumber = bus_number
-        scsi_spec.device.deviceInfo = vim.Description()
-        scsi_spec.device.deviceInfo.label = scsi_controller_label
-        scsi_spec.device.deviceInfo.summary = summary
+    def get_properties(self, obj):
+        """
+        :return: {property path: value} of the given managed object, None if it is not mirrored
+        """
 
-        if bus_sharing == "virtual":
-            scsi_spec.device.sharedBus = vim.vm.device.VirtualSCSIController.Sharing.virtualSharing
+        obj_type = self._get_mirrored_type(obj)
+        if obj_type is None:
+            return None
 
-        elif bus_sharing == "physical":
-            scsi_spec.device.sharedBus = vim.vm.device.VirtualSCSIController.Sharing.physicalSharing
+        with self._lock:
+            item = self._objects[obj_type].get(obj._moId)
 
-        else:
-            scsi_spec.device.sharedBus = vim.vm.device.VirtualSCSIController.Sharing.noSharing
+        if item is None:
+            return None
 
-        return scsi_spec, key
+        return dict(item[1])
 
-    def _add_new_hard_disk(self, disk_label, size_gb, unit_number, controller_key=1000, thin_provision=True, datastore_path=None, vm_name=None):
+    def _get_mirrored_type(self, obj):
+        # The view returns subtypes of the mirrored types as well, e.g. vim.dvs.DistributedVirtualPortgroup for vim.Network
+        concrete_type = type(obj)
+        if concrete_type not in self._mirrored_types:
+            self._mirrored_types[concrete_type] = next((x for x in concrete_type.__mro__ if x in self._properties), None)
 
-        key = random.randint(-2099, -2000)
+        return self._mirrored_types[concrete_type]
 
-        size_kb = int(size_gb * 1024.0 * 1024.0)
+    def _run(self):
+        updates_version = None
+        resync = False
+        wait_options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self.max_wait_seconds)
 
-        disk_spec = vim.vm.device.VirtualDeviceSpec()
-        disk_spec.fileOperation = 'create'
-        disk_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+        while not self._stopped:
+            try:
+                updates_info = self._property_collector.WaitForUpdatesEx(updates_version, wait_options)
+            except Exception as e:
+                if self._stopped:
+                    break
+
+                # Start over from a full update set
+                logging.warning('inventory mirror update failed, resyncing. {0}'.format(e))
+                self._ready.clear()
+                updates_version = None
+                resync = True
+                time.sleep(self.retry_delay_seconds)
+                continue
 
-        disk_spec.device = vim.vm.device.VirtualDisk()
-        disk_spec.device.key = key
-        disk_spec.device.deviceInfo = vim.Description()
-        disk_spec.device.deviceInfo.label = disk_label
-        disk_spec.device.deviceInfo.summary = "{0} GB".format(size_gb)
+            if updates_info is None:
+                continue
 
-        disk_spec.device.backing = vim.vm.device.VirtualDisk.FlatVer2BackingInfo()
-        disk_spec.device.backing.thinProvisioned = thin_provision
-        disk_spec.device.backing.diskMode = 'persistent'
+            if resync:
+                with self._lock:
+                    for objects in self._objects.values():
+                        objects.clear()
+                resync = False
 
-        disk_spec.device.backing.fileName = '{datastore_path}/{disk_label}.vmdk'.format(datastore_path=datastore_path, disk_label=disk_label)
+            updates_version = updates_info.version
 
-        disk_spec.device.controllerKey = controller_key
-        disk_spec.device.unitNumber = unit_number
-        disk_spec.device.capacityInKB = size_kb
+            for filter_set in updates_info.filterSet:
+                self._apply_updates(filter_set.objectSet)
 
-        return disk_spec
+            if not updates_info.truncated:
+                self._ready.set()
 
-    def get_virtual_switches(self):
-        virtual_switches = self._iterate_virtual_switches()
+    def _apply_updates(self, object_updates):
+        stale = []
 
-        for virtual_switch in virtual_switches:
-            yield VirtualSwitch(self, virtual_switch)
+        with self._lock:
+            for object_update in object_updates:
+                obj = object_update.obj
+                obj_type = self._get_mirrored_type(obj)
+                if obj_type is None:
+                    continue
 
-    def ensure_virtual_switch_exists(self, name):
-        if not self.get_virtual_switch(name):
-            self.new_virtual_switch(name)
+                objects = self._objects[obj_type]
 
-    def get_virtual_switch(self, name):
-        virtual_switch = next((x for x in self.get_virtual_switches() if x.name == name), None)
-        return virtual_switch
+                if object_update.kind == 'leave':
+                    objects.pop(obj._moId, None)
+                    continue
 
-    def get_virtual_machine(self, name):
-        virtual_machine = next((x for x in self.get_virtual_machines() if x.name == name), None)
-        return virtual_machine
+                if object_update.kind == 'enter' or obj._moId not in objects:
+                    objects[obj._moId] = (obj, dict.fromkeys(self._properties[obj_type]))
 
-    def new_virtual_switch(self, name, vlan_id=4095, num_ports=128, mtu=4096, allow_promiscuous=True, allow_mac_changes=True, allow_forged_transmits=True):
+                properties = objects[obj._moId][1]
+                for change in object_update.changeSet:
+                    if change.name in properties:
+                        properties[change.name] = None if change.op in ('remove', 'indirectRemove') else change.val
+                    else:
+                        # A nested change (e.g. an element of an array property), re-read the whole declared property
+                        path = next((x for x in properties if change.name.startswith(x + '.') or change.name.startswith(x + '[')), None)
+                        if path:
+                            stale.append((obj_type, obj, path))
 
-        # Ensure that a virtual switch does not exists
-        existing_virtual_switch = self.get_virtual_switch(name)
+        for obj_type, obj, path in stale:
+            try:
+                items = self._client._retrieve_properties(obj_type, [path], objects=[obj])
+            except vmodl.fault.ManagedObjectNotFound:
+                continue
 
-        if existing_virtual_switch:
-            raise Exception('virtual switch "{0}" already exist. id "{1}"'.format(existing_virtual_switch.name, existing_virtual_switch.id))
+            with self._lock:
+                item = self._objects[obj_type].get(obj._moId)
+                for _, properties in items:
+                    if item:
+                        item[1].update(properties)
 
-        vss_spec = vim.host.VirtualSwitch.Specification()
 
-        vss_spec.numPorts = num_ports
-        vss_spec.mtu = mtu
+class _EsxiHost(object):
+    def __init__(self, raw_esxi_host, properties):
+        self.raw = raw_esxi_host
+        self.network_system = properties['configManager.networkSystem']
+        self.service_system = properties['configManager.serviceSystem']
+        self.date_time_system = properties['configManager.dateTimeSystem']
 
-        esxi_host = self._get_single_esxi_host()
 
-        virtual_switch_names = map(lambda x: x.id, self.get_virtual_switches())
-        virtual_switch_name = next('vSwitch{0}'.format(i) for i in xrange(0, num_ports) if 'vSwitch{0}'.format(i) not in virtual_switch_names)
+class TaskResult(object):
+    def __init__(self, task, result=None, error=None, target=None):
+        self.task = task
+        self.result = result
+        self.error = error
+        self.target = target
 
-        esxi_host.configManager.networkSystem.AddVirtualSwitch(vswitchName=virtual_switch_name, spec=vss_spec)
+    @property
+    def succeeded(self):
+        return self.error is None
 
-        port_group_spec = vim.host.PortGroup.Specification()
-        port_group_spec.name = name
-        port_group_spec.vlanId = vlan_id
-        port_group_spec.vswitchName = virtual_switch_name
 
-        port_group_spec.policy = vim.host.NetworkPolicy()
-        port_group_spec.policy.security = vim.host.NetworkPolicy.SecurityPolicy()
-        port_group_spec.policy.security.allowPromiscuous = allow_promiscuous
-        port_group_spec.policy.security.forgedTransmits = allow_forged_transmits
-        port_group_spec.policy.security.macChanges = allow_mac_changes
+class TaskFuture(futures.Future):
+    """
+    concurrent.futures.Future of a vSphere task, completed by the client's background task tracker
+    """
 
-        esxi_host.configManager.networkSystem.AddPortGroup(portgrp=port_group_spec)
+    def __init__(self, task):
+        super(TaskFuture, self).__init__()
+        self.task = task
+        self._on_success = None
 
-        virtual_switch = next(x for x in self.get_virtual_switches() if x.name == name)
-        virtual_switch.update(allow_promiscuous=allow_promiscuous, allow_mac_changes=allow_mac_changes, allow_forged_transmits=allow_forged_transmits)
-        return virtual_switch
+    @classmethod
+    def completed(cls, result=None):
+        future = cls(None)
+        future.set_result(result)
+        return future
 
-    def _get_first_datastore_name(self):
-        datastore = next(self.get_datastores(), None)
+    def cancel(self):
+        if self.done():
+            return False
 
-        if not datastore:
-            raise Exception('There are no datastores available')
+        if self.task is not None:
+            try:
+                self.task.CancelTask()
+            except vmodl.MethodFault:
+                return False
 
-        return datastore['name']
+        return super(TaskFuture, self).cancel()
 
-    def get_guest_operations_manager(self):
-        return self._content.guestOperationsManager
 
+class _TaskTracker(object):
+    """
+    Drives every TaskFuture of a client from a single background thread.
+    Submitting a task adds a filter on a dedicated PropertyCollector, which wakes up the thread's WaitForUpdatesEx long-poll.
+    """
 
-class VirtualMachine(object):
-    def __init__(self, esx_client, raw_virtual_machine):
+    max_wait_seconds = 5
 
-        self._client = esx_client
-        self._raw_virtual_machine = raw_virtual_machine
-        self._tools_credentials = None
-        self.name = raw_virtual_machine.name
-        self.uuid = raw_virtual_machine.summary.config.uuid
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Condition()
+        self._futures = {}
+        self._filters = {}
+        self._task_values = {}
+        self._property_collector = None
+        self._thread = None
+        self._stopped = False
 
-    def get_snapshots(self):
-        if not self._raw_virtual_machine.snapshot:
-            return
+    def submit(self, task, on_success=None):
+        future = TaskFuture(task)
+        future._on_success = on_success
 
-        snapshots = self._raw_virtual_machine.snapshot.rootSnapshotList
-        for snapshot in self._iterate_snapshots(snapshots):
-            yield snapshot
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+        filter_spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=task)]
+        filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info.state', 'info.result', 'info.error'])]
 
-    def _iterate_snapshots(self, snapshots):
-        for snapshot in snapshots:
-            yield Snapshot(self._client, snapshot)
+        with self._lock:
+            if self._stopped:
+                raise Exception('task tracker is stopped')
 
-        child_snapshots = map(lambda x: x.childSnapshotList, snapshots)
-        for child_snapshot in child_snapshots:
-            for snapshot in self._iterate_snapshots(child_snapshot):
-                yield snapshot
+            if self._property_collector is None:
+                self._property_collector = self._client._content.propertyCollector.CreatePropertyCollector()
 
-    def _iterate_network_interfaces(self):
-        for hardware_device in self._raw_virtual_machine.config.hardware.device:
-            if isinstance(hardware_device, vim.vm.device.VirtualEthernetCard):
-                yield hardware_device
+            # Register before creating the filter, its first update may arrive right away
+            self._futures[task._moId] = future
+            self._task_values[task._moId] = {}
 
-    def _iterate_disks(self):
-        for hardware_device in self._raw_virtual_machine.config.hardware.device:
-            if isinstance(hardware_device, vim.vm.device.VirtualDisk):
-                yield hardware_device
+            try:
+                self._filters[task._moId] = self._property_collector.CreateFilter(filter_spec, True)
+            except Exception:
+                del self._futures[task._moId]
+                del self._task_values[task._moId]
+                raise
 
-    def power_on(self, verify_state=True):
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='vmwc-task-tracker')
+                self._thread.daemon = True
+                self._thread.start()
 
-        if verify_state:
-            self.refresh()
-            if self.is_powered_on():
-                return
+            self._lock.notify()
 
-        task = self._raw_virtual_machine.PowerOnVM_Task()
-        self._client.wait(task)
+        return future
 
-    def rename(self, new_name):
-        task = self._raw_virtual_machine.Rename_Task(new_name)
-        self._client.wait(task)
-        self.name = new_name
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify()
+            thread = self._thread
+            property_collector = self._property_collector
 
-    def shutdown(self, verify_state=True):
+        if property_collector is not None:
+            try:
+                property_collector.CancelWaitForUpdates()
+            except Exception:
+                pass
 
-        if verify_state:
-            self.refresh()
-            if self.is_powered_off():
-                return
+        if thread is not None:
+            thread.join(self.max_wait_seconds)
 
-        self._raw_virtual_machine.ShutdownGuest()
+        if property_collector is not None:
+            try:
+                property_collector.DestroyPropertyCollector()
+            except Exception:
+                pass
 
-    def power_off(self, verify_state=True):
+    def _run(self):
+        updates_version = None
+        wait_options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self.max_wait_seconds)
 
-        if verify_state:
-            self.refresh()
-            if self.is_powered_off():
-                return
+        while True:
+            with self._lock:
+                while not self._stopped and not self._futures:
+                    self._lock.wait()
 
-        task = self._raw_virtual_machine.PowerOffVM_Task()
-        self._client.wait(task)
+                if self._stopped:
+                    break
 
-    def reboot(self):
-        task = self._raw_virtual_machine.ResetVM_Task()
-        self._client.wait(task)
+                property_collector = self._property_collector
 
-    def remove_all_snapshots(self, consolidate=False):
-        task = self._raw_virtual_machine.RemoveAllSnapshots_Task(consolidate)
-        self._client.wait(task)
+            try:
+                updates_info = property_collector.WaitForUpdatesEx(updates_version, wait_options)
+            except Exception as e:
+                if self._stopped:
+                    break
 
-    def delete(self):
-        task = self._raw_virtual_machine.Destroy_Task()
-        self._client.wait(task)
+                self._fail_all(e)
+                updates_version = None
+                continue
 
-    def take_snapshot(self, name, description="", memory=False, try_persist_disk=True):
-        task = self._raw_virtual_machine.CreateSnapshot(name, description, memory, try_persist_disk)
-        self._client.wait(task)
+            if updates_info is None:
+                continue
 
-    def configure_bios(self, enter_bios=None, boot_delay=None, boot_order=None):
-        spec = vim.vm.ConfigSpec()
-        spec.bootOptions = vim.vm.BootOptions()
+            updates_version = updates_info.version
 
-        if boot_order is not None:
-            spec.bootOptions.bootOrder = []
+            for filter_set in updates_info.filterSet:
+                for object_set in filter_set.objectSet:
+                    self._apply_update(object_set)
 
-            for device in boot_order:
+        self._fail_all(Exception('task tracker is stopped'))
 
-                if device == 'network':
-                    first_network_interface = next(self._iterate_network_interfaces(), None)
-                    if not first_network_interface:
-                        raise Exception('There is no network interface to boot from. you need to configure at least 1 network interface first')
+    def _apply_update(self, object_set):
+        task_id = object_set.obj._moId
 
-                    boot_device = vim.vm.BootOptions.BootableEthernetDevice(deviceKey=first_network_interface.key)
+        with self._lock:
+            values = self._task_values.get(task_id)
+            if values is None:
+                return
 
-                elif device == 'disk':
-                    first_disk = next(self._iterate_disks(), None)
-                    if not first_disk:
-                        raise Exception('There is no disks to boot from. you need to configure at least 1 disk first')
+            for change in object_set.changeSet:
+                values[change.name] = change.val
 
-                    boot_device = vim.vm.BootOptions.BootableDiskDevice(deviceKey=first_disk.key)
+            task_state = values.get('info.state')
+            if task_state not in (vim.TaskInfo.State.success, vim.TaskInfo.State.error):
+                return
 
-                elif device == 'cdrom':
-                    boot_device = vim.vm.BootOptions.BootableCdromDevice()
+            future = self._futures.pop(task_id)
+            property_filter = self._filters.pop(task_id)
+            del self._task_values[task_id]
 
-                else:
-                    raise Exception('device "{}" is not supported'.format(device))
+        try:
+            property_filter.Destroy()
+        except vmodl.MethodFault:
+            pass
 
-                spec.bootOptions.bootOrder.append(boot_device)
+        self._complete(future, values)
 
-        if boot_delay is not None:
-            spec.bootOptions.bootDelay = boot_delay
+    def _complete(self, future, values):
+        # Cancelled futures have already been resolved
+        if not future.set_running_or_notify_cancel():
+            return
 
-        if enter_bios is not None:
-            spec.bootOptions.enterBIOSSetup = enter_bios
+        try:
+            if values.get('info.state') == vim.TaskInfo.State.error:
+                raise Exception(values.get('info.error'))
 
-        task = self._raw_virtual_machine.ReconfigVM_Task(spec=spec)
-        self._client.wait(task)
+            result = values.get('info.result')
+            if future._on_success:
+                future._on_success(result)
 
-    def refresh(self):
+        except Exception as e:
+            future.set_exception(e)
+            return
 
-        virtual_machine = next((x for x in self._client.get_virtual_machines() if x.uuid == self.uuid), None)
-        if not virtual_machine:
-            raise Exception('Virtual Machine "{}" is missing'.format(self.name))
+        future.set_result(result)
 
-        self.__dict__.update(virtual_machine.__dict__)
+    def _fail_all(self, error):
+        with self._lock:
+            pending_futures = list(self._futures.values())
+            property_filters = list(self._filters.values())
+            self._futures.clear()
+            self._filters.clear()
+            self._task_values.clear()
 
-    def is_powered_on(self):
-        return self._raw_virtual_machine.runtime.powerState == 'poweredOn'
+        for property_filter in property_filters:
+            try:
+                property_filter.Destroy()
+            except Exception:
+                pass
 
-    def is_powered_off(self):
-        return self._raw_virtual_machine.runtime.powerState == 'poweredOff'
+        for future in pending_futures:
+            if not future.done():
+                future.set_exception(error)
 
-    def is_suspended(self):
-        return self._raw_virtual_machine.runtime.powerState == 'suspended'
 
-    def remove_all_network_interfaces(self):
+class GuestProcessResult(object):
+    def __init__(self, pid, exit_code, start_time, end_time, stdout=None, stderr=None, error=None, target=None):
+        self.pid = pid
+        self.exit_code = exit_code
+        self.start_time = start_time
+        self.end_time = end_time
+        self.stdout = stdout
+        self.stderr = stderr
+        self.error = error
+        self.target = target
 
-        spec = vim.vm.ConfigSpec()
-        spec.deviceChange = []
+    @property
+    def succeeded(self):
+        return self.error is None and self.exit_code == 0
 
-        for network_interface in self._iterate_network_interfaces():
-            virtual_nic_spec = vim.vm.device.VirtualDeviceSpec()
-            virtual_nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.remove
-            virtual_nic_spec.device = network_interface
+    @property
+    def duration_seconds(self):
+        if self.start_time is None or self.end_time is None:
+            return None
 
-            spec.deviceChange.append(virtual_nic_spec)
+        return (self.end_time - self.start_time).total_seconds()
 
-        task = self._raw_virtual_machine.ReconfigVM_Task(spec=spec)
-        self._client.wait(task)
 
-    def add_network_interface(self, network_name, adapter_type='vmxnet3'):
+class _Backoff(object):
+    """
+    Sleep intervals growing from a few milliseconds up to a cap, for polling operations that are usually short
+    """
 
-        network_spec = self._client._add_new_network_interface(network_name, adapter_type)
+    def __init__(self, initial_seconds=0.05, factor=1.5, max_seconds=2):
+        self._initial_seconds = initial_seconds
+        self._delay = initial_seconds
+        self._factor = factor
+        self._max_seconds = max_seconds
 
-        spec = vim.vm.ConfigSpec()
-        spec.deviceChange = [network_spec]
-        task = self._raw_virtual_machine.ReconfigVM_Task(spec=spec)
-        self._client.wait(task)
+    def next_delay(self):
+        delay = self._delay
+        self._delay = min(self._delay * self._factor, self._max_seconds)
+        return delay
 
-    def get_network_interfaces(self):
+    def sleep(self):
+        time.sleep(self.next_delay())
 
-        for network_interface in self._iterate_network_interfaces():
-            yield {
-                "mac_address": network_interface.macAddress,
-                "label": network_interface.deviceInfo.label,
-                "network": network_interface.deviceInfo.summary
-            }
+    def reset(self):
+        self._delay = self._initial_seconds
 
-    def get_snapshot(self, name):
-        snapshot = next((x for x in self.get_snapshots() if x.name == name), None)
-        return snapshot
 
-    def get_tools_status(self):
-        return self._raw_virtual_machine.guest.toolsStatus
+class _DeviceKeyAllocator(object):
+    """
+    Hands out the temporary keys of devices added by a ConfigSpec. they only have to be negative and unique within the spec
+    """
 
-    def is_tools_working_properly(self):
-        tools_status = self.get_tools_status()
-        return (tools_status != "toolsNotInstalled" and
-                tools_status != "toolsNotRunning")
+    def __init__(self):
+        self._next_key = -100
 
-    def vmware_tools_login(self, username, password):
-        self._tools_credentials = vim.vm.guest.NamePasswordAuthentication(username=username,
-                                                                          password=password)
+    def allocate(self):
+        key = self._next_key
+        self._next_key -= 1
+        return key
 
-    def vmware_tools_execute_process(self, program_path, working_directory, arguments="", environment_variables=None):
-        self._ensure_vmware_tools_logged_in()
 
-        spec = vim.vm.guest.ProcessManager.ProgramSpec(programPath=program_path,
-                                                       arguments=arguments,
-                                                       workingDirectory=working_directory,
-                                                       envVariables=environment_variables)
+class _RangeNotSupported(Exception):
+    pass
 
-        self._client.get_guest_operations_manager().processManager.StartProgramInGuest(vm=self._raw_virtual_machine,
-                                                                                       auth=self._tools_credentials,
-                                                                                       spec=spec)
 
-    def _ensure_vmware_tools_logged_in(self):
-        if self._tools_credentials is None:
-            raise Exception("VMWare tools login is required in order to use this functionality")
+class _DownloadProgress(object):
+    def __init__(self, total_size, callback=None):
+        self.total_size = total_size
+        self.downloaded_size = 0
+        self._callback = callback
+        self._lock = threading.Lock()
 
-    def vmware_tools_upload_file(self, local_file_path, remote_file_path):
-        self._ensure_vmware_tools_logged_in()
+    def add(self, size):
+        with self._lock:
+            self.downloaded_size += size
+            downloaded_size = self.downloaded_size
 
-        with open(local_file_path, "rb") as fin:
-            data = fin.read()
+        if self._callback and size:
+            self._callback(downloaded_size, self.total_size)
 
-        file_attributes = vim.vm.guest.FileManager.FileAttributes()
-        url = self._client.get_guest_operations_manager().fileManager.InitiateFileTransferToGuest(vm=self._raw_virtual_machine,
-                                                                                                  auth=self._tools_credentials,
-                                                                                                  guestFilePath=remote_file_path,
-                                                                                                  fileAttributes=file_attributes,
-                                                                                                  fileSize=len(data),
-                                                                                                  overwrite=True)
+    def reset(self):
+        with self._lock:
+            self.downloaded_size = 0
 
-        url = self._normalize_url(url)
-        r = requests.put(url, data=data, verify=False)
-        r.raise_for_status()
 
-    def _normalize_url(self, url):
-        return url.replace("https://*", "https://" + self._client.host)
+class _SizedStream(object):
+    """
+    Streamed request body of a known, non-zero size. Exposing only __len__ and __iter__ makes requests send a Content-Length header
+    and write the body chunk by chunk, instead of loading it or falling back to chunked transfer encoding
+    """
 
-    def vmware_tools_download_file(self, local_file_path, remote_file_path, chunk_size=1024):
-        self._ensure_vmware_tools_logged_in()
+    chunk_size = 1024 * 1024
 
-        fti = self._client.get_guest_operations_manager().fileManager.InitiateFileTransferFromGuest(vm=self._raw_virtual_machine,
-                                                                                                    auth=self._tools_credentials,
-                                                                                                    guestFilePath=remote_file_path)
+    def __init__(self, stream, size):
+        self._stream = stream
+        self._size = size
 
-        url = self._normalize_url(fti.url)
-        r = requests.get(url, verify=self._client.verify)
-        r.raise_for_status()
+    def __len__(self):
+        return self._size
 
-        size = 0
-        with open(local_file_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    size += len(chunk)
-        return size
+    def __iter__(self):
+        sent = 0
+        for chunk in self._iterate_chunks():
+            sent += len(chunk)
+            if sent > self._size:
+                raise Exception('stream provided more than the declared {0} bytes'.format(self._size))
 
-    def vmware_tools_create_temporary_directory(self, prefix, suffix=""):
-        self._ensure_vmware_tools_logged_in()
+            yield chunk
 
-        temporary_directory = self._client.get_guest_operations_manager().fileManager.CreateTemporaryDirectoryInGuest(vm=self._raw_virtual_machine,
-                                                                                                                      auth=self._tools_credentials,
-                                                                                                                      prefix=prefix,
-                                                                                                                      suffix=suffix)
-        return temporary_directory
+        if sent != self._size:
+            raise Exception('stream provided {0} bytes instead of the declared {1} bytes'.format(sent, self._size))
 
-    def vmware_tools_list_processes(self, pids=None, max_retries=5, retry_delay_seconds=5):
-        self._ensure_vmware_tools_logged_in()
+    def _iterate_chunks(self):
+        if hasattr(self._stream, 'read'):
+            while True:
+                chunk = self._stream.read(self.chunk_size)
+                if not chunk:
+                    break
 
-        attempt = 0
-        while True:
-            try:
-                response = self._client.get_guest_operations_manager().processManager.ListProcessesInGuest(vm=self._raw_virtual_machine,
-                                                                                                           auth=self._tools_credentials,
-                                                                                                           pids=pids)
-                return response
-            except:
-                attempt += 1
-                if attempt > max_retries:
-                    raise
-                time.sleep(retry_delay_seconds)
+                yield chunk
+        else:
+            for chunk in self._stream:
+                if chunk:
+                    yield chunk
 
 
 class VirtualSwitch(object):
@@ -831,7 +3251,11 @@ class VirtualSwitch(object):
 
     def delete(self):
         esxi_host = self._esx_client._get_single_esxi_host()
-        esxi_host.configManager.networkSystem.RemoveVirtualSwitch(vswitchName=self.id)
+        esxi_host.network_system.RemoveVirtualSwitch(vswitchName=self.id)
+        self._esx_client._virtual_switch_index = None
+
+        # Its port groups (networks) are gone as well
+        self._esx_client._managed_object_indexes.pop(vim.Network, None)
 
     def update(self, allow_promiscuous=None, allow_mac_changes=None, allow_forged_transmits=None, mtu=None):
         dirty = False
@@ -855,7 +3279,8 @@ class VirtualSwitch(object):
 
         if dirty:
             esxi_host = self._esx_client._get_single_esxi_host()
-            esxi_host.configManager.networkSystem.UpdateVirtualSwitch(vswitchName=self.id, spec=spec)
+            esxi_host.network_system.UpdateVirtualSwitch(vswitchName=self.id, spec=spec)
+            self._esx_client._virtual_switch_index = None
 
     @staticmethod
     def _parse_name(raw_virtual_switch):
@@ -871,8 +3296,75 @@ class VirtualSwitch(object):
         return name
 
 
+class SnapshotTree(object):
+    """
+    Indexed view of a virtual machine's snapshot hierarchy, built from a single read of its "snapshot" property.
+    Snapshots are iterated level by level, lookups by id, name and path do not walk the tree
+    """
+
+    def __init__(self, esx_client, snapshot_info):
+        self.roots = []
+        self.current = None
+        self._snapshots = []
+        self._by_id = {}
+        self._by_name = {}
+        self._by_path = {}
+
+        if not snapshot_info:
+            return
+
+        by_reference = {}
+        pending = collections.deque((x, None) for x in snapshot_info.rootSnapshotList or [])
+        while pending:
+            raw_snapshot, parent = pending.popleft()
+
+            snapshot = Snapshot(esx_client, raw_snapshot, parent)
+            if parent is None:
+                self.roots.append(snapshot)
+            else:
+                parent.children.append(snapshot)
+
+            self._snapshots.append(snapshot)
+            self._by_id[snapshot.id] = snapshot
+            self._by_name.setdefault(snapshot.name, []).append(snapshot)
+            self._by_path.setdefault(snapshot.path, snapshot)
+            by_reference[raw_snapshot.snapshot] = snapshot
+
+            for child in raw_snapshot.childSnapshotList or []:
+                pending.append((child, snapshot))
+
+        if snapshot_info.currentSnapshot is not None:
+            self.current = by_reference.get(snapshot_info.currentSnapshot)
+            if self.current:
+                self.current.is_current = True
+
+    def __iter__(self):
+        return iter(self._snapshots)
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def get_by_id(self, snapshot_id):
+        return self._by_id.get(snapshot_id)
+
+    def get_by_name(self, name):
+        # Snapshot names are not unique, the shallowest match wins
+        snapshots = self._by_name.get(name)
+        return snapshots[0] if snapshots else None
+
+    def get_all_by_name(self, name):
+        return list(self._by_name.get(name, []))
+
+    def get_by_path(self, path):
+        """
+        :param path: snapshot names from a root snapshot down, separated by "/", e.g. 'base/configured/tested'
+        """
+
+        return self._by_path.get(path)
+
+
 class Snapshot(object):
-    def __init__(self, esx_client, raw_snapshot):
+    def __init__(self, esx_client, raw_snapshot, parent=None):
         self._esx_client = esx_client
         self._raw_snapshot = raw_snapshot
         self.id = raw_snapshot.id
@@ -880,15 +3372,28 @@ class Snapshot(object):
         self.description = raw_snapshot.description
         self.timestamp = raw_snapshot.createTime
         self.is_powered_on = raw_snapshot.state == 'poweredOn'
+        self.is_current = False
+        self.parent = parent
+        self.children = []
+        self.path = '{0}/{1}'.format(parent.path, self.name) if parent else self.name
 
     def rename(self, name, description):
-        task = self._raw_snapshot.snapshot.RenameSnapshot(name, description)
-        self._esx_client.wait(task)
+        # RenameSnapshot is synchronous, there is no task to wait for
+        self._raw_snapshot.snapshot.RenameSnapshot(name, description)
+        self.name = name
+        self.description = description
 
-    def revert(self):
+    def revert(self, wait=True):
         task = self._raw_snapshot.snapshot.RevertToSnapshot_Task()
-        self._esx_client.wait(task)
+        return self._esx_client._run_task(task, wait)
 
-    def delete(self, remove_children=True):
+    def delete(self, remove_children=True, wait=True):
         task = self._raw_snapshot.snapshot.RemoveSnapshot_Task(remove_children)
-        self._esx_client.wait(task)
+        return self._esx_client._run_task(task, wait)
+
+
+# ----------------------------------
+# asyncio facade, requires python 3.5+
+
+if sys.version_info >= (3, 5):
+    from vmwc.aio import AsyncVMWareClient, AsyncVirtualMachine  # noqa: F401
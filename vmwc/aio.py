@@ -0,0 +1,373 @@
+"""
+asyncio facade of vmwc (python 3.5+)
+
+Blocking SOAP calls are offloaded to a bounded thread pool and task completion is delivered
+through the client's background task tracker, so awaiting a task does not hold a thread.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from vmwc import TaskResult, VMWareClient
+
+
+class AsyncVMWareClient(object):
+    def __init__(self, host, username, password, port=443, verify=False, max_workers=10, **kwargs):
+        """
+        :param kwargs: further VMWareClient options, e.g. session_cache_path, keepalive_seconds, http_pool_maxsize
+        """
+
+        self.client = VMWareClient(host, username, password, port=port, verify=verify, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def __aenter__(self):
+        await self.run(self.client.__enter__)
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        try:
+            await self.run(self.client.__exit__, type, value, traceback)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def run(self, function, *args, **kwargs):
+        """
+        Runs a blocking call on the client's executor
+        :return: awaitable of the call's return value
+        """
+
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def run_task(self, function, *args, **kwargs):
+        """
+        Runs a vmwc operation with wait=False on the executor, then awaits its TaskFuture without holding a thread
+        """
+
+        kwargs['wait'] = False
+        future = await self.run(function, *args, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    async def wait(self, task):
+        future = await self.run(self.client.track, task)
+        return await asyncio.wrap_future(future)
+
+    async def wait_all(self, tasks):
+        """
+        Waits for all the given tasks to complete, a failed task does not abort the others
+        :return: list of TaskResult, in the same order as the given tasks
+        """
+
+        tasks = list(tasks)
+        outcomes = await asyncio.gather(*[self.wait(task) for task in tasks], return_exceptions=True)
+        return [TaskResult(task, error=x) if isinstance(x, BaseException) else TaskResult(task, result=x) for task, x in zip(tasks, outcomes)]
+
+    async def get_virtual_machines(self):
+        virtual_machines = await self.run(list, self.client.get_virtual_machines())
+        return [AsyncVirtualMachine(self, x) for x in virtual_machines]
+
+    async def get_virtual_machine(self, name):
+        virtual_machine = await self.run(self.client.get_virtual_machine, name)
+        return AsyncVirtualMachine(self, virtual_machine) if virtual_machine else None
+
+    async def get_virtual_machine_by_uuid(self, uuid):
+        virtual_machine = await self.run(self.client.get_virtual_machine_by_uuid, uuid)
+        return AsyncVirtualMachine(self, virtual_machine) if virtual_machine else None
+
+    async def new_virtual_machine(self, name, **kwargs):
+        virtual_machine = await self.run(self.client.new_virtual_machine, name, **kwargs)
+        return AsyncVirtualMachine(self, virtual_machine) if virtual_machine else None
+
+    async def revert_to_snapshot(self, vm_name, snapshot_name):
+        await self.run(self.client.revert_to_snapshot, vm_name, snapshot_name)
+
+    async def get_datastores(self):
+        return await self.run(list, self.client.get_datastores())
+
+    async def get_services(self):
+        return await self.run(list, self.client.get_services())
+
+    async def start_service(self, service_id):
+        await self.run(self.client.start_service, service_id)
+
+    async def stop_service(self, service_id):
+        await self.run(self.client.stop_service, service_id)
+
+    async def restart_service(self, service_id):
+        await self.run(self.client.restart_service, service_id)
+
+    async def enable_ssh(self):
+        await self.run(self.client.enable_ssh)
+
+    async def disable_ssh(self):
+        await self.run(self.client.disable_ssh)
+
+    async def get_server_datetime(self):
+        return await self.run(self.client.get_server_datetime)
+
+    async def set_server_datetime(self, new_value=None):
+        await self.run(self.client.set_server_datetime, new_value)
+
+    async def get_virtual_switches(self):
+        virtual_switches = await self.run(list, self.client.get_virtual_switches())
+        return [AsyncVirtualSwitch(self, x) for x in virtual_switches]
+
+    async def get_virtual_switch(self, name):
+        virtual_switch = await self.run(self.client.get_virtual_switch, name)
+        return AsyncVirtualSwitch(self, virtual_switch) if virtual_switch else None
+
+    async def new_virtual_switch(self, name, **kwargs):
+        virtual_switch = await self.run(self.client.new_virtual_switch, name, **kwargs)
+        return AsyncVirtualSwitch(self, virtual_switch) if virtual_switch else None
+
+
+class AsyncVirtualMachine(object):
+    def __init__(self, async_client, virtual_machine):
+        self._async_client = async_client
+        self.virtual_machine = virtual_machine
+
+    @property
+    def name(self):
+        return self.virtual_machine.name
+
+    @property
+    def uuid(self):
+        return self.virtual_machine.uuid
+
+    async def refresh(self, properties=None):
+        await self._async_client.run(self.virtual_machine.refresh, properties)
+
+    async def is_powered_on(self):
+        return await self._async_client.run(self.virtual_machine.is_powered_on)
+
+    async def is_powered_off(self):
+        return await self._async_client.run(self.virtual_machine.is_powered_off)
+
+    async def is_suspended(self):
+        return await self._async_client.run(self.virtual_machine.is_suspended)
+
+    async def power_on(self, verify_state=True):
+        return await self._async_client.run_task(self.virtual_machine.power_on, verify_state=verify_state)
+
+    async def power_off(self, verify_state=True):
+        return await self._async_client.run_task(self.virtual_machine.power_off, verify_state=verify_state)
+
+    async def shutdown(self, verify_state=True):
+        await self._async_client.run(self.virtual_machine.shutdown, verify_state=verify_state)
+
+    async def reboot(self):
+        return await self._async_client.run_task(self.virtual_machine.reboot)
+
+    async def rename(self, new_name):
+        return await self._async_client.run_task(self.virtual_machine.rename, new_name)
+
+    async def delete(self):
+        return await self._async_client.run_task(self.virtual_machine.delete)
+
+    async def take_snapshot(self, name, description="", memory=False, try_persist_disk=True):
+        return await self._async_client.run_task(self.virtual_machine.take_snapshot, name, description, memory, try_persist_disk)
+
+    async def remove_all_snapshots(self, consolidate=False):
+        return await self._async_client.run_task(self.virtual_machine.remove_all_snapshots, consolidate)
+
+    async def configure_bios(self, enter_bios=None, boot_delay=None, boot_order=None):
+        return await self._async_client.run_task(self.virtual_machine.configure_bios, enter_bios=enter_bios, boot_delay=boot_delay, boot_order=boot_order)
+
+    async def remove_all_network_interfaces(self):
+        return await self._async_client.run_task(self.virtual_machine.remove_all_network_interfaces)
+
+    async def add_network_interface(self, network_name, adapter_type='vmxnet3'):
+        return await self._async_client.run_task(self.virtual_machine.add_network_interface, network_name, adapter_type)
+
+    async def get_network_interfaces(self):
+        return await self._async_client.run(list, self.virtual_machine.get_network_interfaces())
+
+    async def get_snapshots(self):
+        snapshots = await self._async_client.run(list, self.virtual_machine.get_snapshots())
+        return [AsyncSnapshot(self._async_client, x) for x in snapshots]
+
+    async def get_snapshot_tree(self):
+        snapshot_tree = await self._async_client.run(self.virtual_machine.get_snapshot_tree)
+        return AsyncSnapshotTree(self._async_client, snapshot_tree)
+
+    async def get_snapshot(self, name):
+        snapshot = await self._async_client.run(self.virtual_machine.get_snapshot, name)
+        return AsyncSnapshot(self._async_client, snapshot) if snapshot else None
+
+    async def revert_to_snapshot(self, snapshot_name):
+        snapshot = await self.get_snapshot(snapshot_name)
+        if not snapshot:
+            raise Exception('virtual machine "{0}" does not have a snapshot named "{1}"'.format(self.name, snapshot_name))
+
+        return await snapshot.revert()
+
+    async def get_tools_status(self):
+        return await self._async_client.run(self.virtual_machine.get_tools_status)
+
+    async def is_tools_working_properly(self):
+        return await self._async_client.run(self.virtual_machine.is_tools_working_properly)
+
+    def vmware_tools_login(self, username, password):
+        # Only keeps the credentials, there is no call to await
+        self.virtual_machine.vmware_tools_login(username, password)
+
+    async def vmware_tools_execute_process(self, program_path, working_directory, arguments="", environment_variables=None):
+        return await self._async_client.run(self.virtual_machine.vmware_tools_execute_process, program_path, working_directory,
+                                            arguments=arguments, environment_variables=environment_variables)
+
+    async def vmware_tools_run(self, program_path, arguments="", working_directory=None, environment_variables=None, capture_output=False, timeout=None):
+        return await self._async_client.run(self.virtual_machine.vmware_tools_run, program_path, arguments=arguments, working_directory=working_directory,
+                                            environment_variables=environment_variables, capture_output=capture_output, timeout=timeout)
+
+    async def vmware_tools_list_processes(self, pids=None, max_retries=5, retry_delay_seconds=5):
+        return await self._async_client.run(self.virtual_machine.vmware_tools_list_processes, pids=pids, max_retries=max_retries, retry_delay_seconds=retry_delay_seconds)
+
+    async def vmware_tools_upload_file(self, local_file_path, remote_file_path):
+        await self._async_client.run(self.virtual_machine.vmware_tools_upload_file, local_file_path, remote_file_path)
+
+    async def vmware_tools_upload_stream(self, stream, remote_file_path, size):
+        await self._async_client.run(self.virtual_machine.vmware_tools_upload_stream, stream, remote_file_path, size)
+
+    async def vmware_tools_download_file(self, local_file_path, remote_file_path, chunk_size=1024 * 1024, progress_callback=None, resume=False, segments=1):
+        # progress_callback is called from the executor's threads
+        return await self._async_client.run(self.virtual_machine.vmware_tools_download_file, local_file_path, remote_file_path, chunk_size=chunk_size,
+                                            progress_callback=progress_callback, resume=resume, segments=segments)
+
+    async def vmware_tools_create_temporary_directory(self, prefix, suffix=""):
+        return await self._async_client.run(self.virtual_machine.vmware_tools_create_temporary_directory, prefix, suffix)
+
+    async def vmware_tools_create_directory(self, remote_directory_path, create_parents=True):
+        await self._async_client.run(self.virtual_machine.vmware_tools_create_directory, remote_directory_path, create_parents)
+
+    async def vmware_tools_delete_file(self, remote_file_path):
+        await self._async_client.run(self.virtual_machine.vmware_tools_delete_file, remote_file_path)
+
+    async def vmware_tools_list_files(self, remote_directory_path):
+        return await self._async_client.run(list, self.virtual_machine.vmware_tools_list_files(remote_directory_path))
+
+    async def vmware_tools_upload_tree(self, local_directory_path, remote_directory_path, max_workers=4, pack=False):
+        return await self._async_client.run(self.virtual_machine.vmware_tools_upload_tree, local_directory_path, remote_directory_path, max_workers=max_workers, pack=pack)
+
+    async def vmware_tools_download_tree(self, remote_directory_path, local_directory_path, max_workers=4, pack=False):
+        return await self._async_client.run(self.virtual_machine.vmware_tools_download_tree, remote_directory_path, local_directory_path, max_workers=max_workers, pack=pack)
+
+
+class AsyncVirtualSwitch(object):
+    def __init__(self, async_client, virtual_switch):
+        self._async_client = async_client
+        self.virtual_switch = virtual_switch
+
+    @property
+    def id(self):
+        return self.virtual_switch.id
+
+    @property
+    def name(self):
+        return self.virtual_switch.name
+
+    @property
+    def mtu(self):
+        return self.virtual_switch.mtu
+
+    @property
+    def key(self):
+        return self.virtual_switch.key
+
+    async def delete(self):
+        await self._async_client.run(self.virtual_switch.delete)
+
+    async def update(self, allow_promiscuous=None, allow_mac_changes=None, allow_forged_transmits=None, mtu=None):
+        await self._async_client.run(self.virtual_switch.update, allow_promiscuous=allow_promiscuous, allow_mac_changes=allow_mac_changes,
+                                     allow_forged_transmits=allow_forged_transmits, mtu=mtu)
+
+
+class AsyncSnapshotTree(object):
+    """
+    Wraps a SnapshotTree, lookups are local and do not need to be awaited
+    """
+
+    def __init__(self, async_client, snapshot_tree):
+        self._async_client = async_client
+        self.snapshot_tree = snapshot_tree
+
+    def _wrap(self, snapshot):
+        return AsyncSnapshot(self._async_client, snapshot) if snapshot else None
+
+    @property
+    def roots(self):
+        return [self._wrap(x) for x in self.snapshot_tree.roots]
+
+    @property
+    def current(self):
+        return self._wrap(self.snapshot_tree.current)
+
+    def __iter__(self):
+        return (self._wrap(x) for x in self.snapshot_tree)
+
+    def __len__(self):
+        return len(self.snapshot_tree)
+
+    def get_by_id(self, snapshot_id):
+        return self._wrap(self.snapshot_tree.get_by_id(snapshot_id))
+
+    def get_by_name(self, name):
+        return self._wrap(self.snapshot_tree.get_by_name(name))
+
+    def get_all_by_name(self, name):
+        return [self._wrap(x) for x in self.snapshot_tree.get_all_by_name(name)]
+
+    def get_by_path(self, path):
+        return self._wrap(self.snapshot_tree.get_by_path(path))
+
+
+class AsyncSnapshot(object):
+    def __init__(self, async_client, snapshot):
+        self._async_client = async_client
+        self.snapshot = snapshot
+
+    @property
+    def id(self):
+        return self.snapshot.id
+
+    @property
+    def name(self):
+        return self.snapshot.name
+
+    @property
+    def description(self):
+        return self.snapshot.description
+
+    @property
+    def timestamp(self):
+        return self.snapshot.timestamp
+
+    @property
+    def is_powered_on(self):
+        return self.snapshot.is_powered_on
+
+    @property
+    def is_current(self):
+        return self.snapshot.is_current
+
+    @property
+    def path(self):
+        return self.snapshot.path
+
+    @property
+    def parent(self):
+        parent = self.snapshot.parent
+        return AsyncSnapshot(self._async_client, parent) if parent else None
+
+    @property
+    def children(self):
+        return [AsyncSnapshot(self._async_client, x) for x in self.snapshot.children]
+
+    async def rename(self, name, description):
+        await self._async_client.run(self.snapshot.rename, name, description)
+
+    async def revert(self):
+        return await self._async_client.run_task(self.snapshot.revert)
+
+    async def delete(self, remove_children=True):
+        return await self._async_client.run_task(self.snapshot.delete, remove_children)